@@ -4,90 +4,240 @@
 """
 
 import hashlib
+import hmac
 import logging
-from typing import Optional
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from enum import IntFlag
+from functools import lru_cache
+from typing import Dict, Final, Optional, Tuple, Union
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Параметры scrypt: ~32 МБ памяти и десятки миллисекунд на одну проверку
+_SCRYPT_N: Final = 2 ** 15
+_SCRYPT_R: Final = 8
+_SCRYPT_P: Final = 1
+_SCRYPT_MAXMEM: Final = 64 * 1024 * 1024
+# Хеши храним и сравниваем как сырые 32 байта, без hex-представления
+_DIGEST_SIZE: Final = 32
+
+# Максимальный размер кэша успешно проверенных паролей
+_ROLE_CACHE_SIZE: Final = 128
+
+# Интервал (сек) сводного логирования неудачных попыток входа
+_FAILED_LOG_INTERVAL: Final = 60
+
+# Ограничение перебора: не больше _FAILED_LIMIT неудач за _FAILED_WINDOW секунд
+# (отдельно для каждого пользователя Telegram)
+_FAILED_LIMIT: Final = 32
+_FAILED_WINDOW: Final = 60
+# Сколько пользователей с неудачными попытками хранится одновременно
+_FAILED_TRACKED_USERS: Final = 4096
+
+# Интернированные строки ролей: сравнение с ними сводится к сравнению указателей
+_ADMIN: Final = sys.intern('admin')
+_USER: Final = sys.intern('user')
+
+# Роль по маске совпадений (admin << 1 | user): выбор без ветвлений
+_ROLE_BY_MATCH: Final[Tuple[Optional[str], ...]] = (None, _USER, _ADMIN, _ADMIN)
+
+class Permission(IntFlag):
+    """Права пользователей в виде битовой маски"""
+    CREATE_TASK = 1
+    ASSIGN_TASK = 2
+    VIEW_ALL = 4
+    REPORTS = 8
+    MANAGE_USERS = 16
+    MODIFY_ANY = 32
+
+# Маска прав для каждой роли
+_ROLE_PERMS: Final[Dict[str, int]] = {
+    _ADMIN: (Permission.CREATE_TASK | Permission.ASSIGN_TASK | Permission.VIEW_ALL |
+              Permission.REPORTS | Permission.MANAGE_USERS | Permission.MODIFY_ANY),
+    _USER: Permission(0)
+}
+
+def _kdf(password: bytes, salt: bytes) -> bytes:
+    """Хеширование пароля (scrypt с солью)"""
+    return hashlib.scrypt(
+        password,
+        salt=salt,
+        n=_SCRYPT_N,
+        r=_SCRYPT_R,
+        p=_SCRYPT_P,
+        maxmem=_SCRYPT_MAXMEM,
+        dklen=_DIGEST_SIZE
+    )
+
+@lru_cache(maxsize=4)
+def _password_digests(admin_password: str, user_password: str, salt: str) -> Tuple[bytes, bytes]:
+    """Хеши паролей из конфигурации: считаются один раз на процесс"""
+    salt_bytes = salt.encode()
+    return _kdf(admin_password.encode(), salt_bytes), _kdf(user_password.encode(), salt_bytes)
+
 class AuthManager:
     """Менеджер аутентификации и авторизации"""
     
+    __slots__ = ('admin_password_digest', 'user_password_digest', '_role_cache',
+                 '_failed_count', '_failed_logged_at', '_failure_times', '_salt', '_lock')
+    
     def __init__(self):
-        self.admin_password_hash = self._hash_password(config.ADMIN_PASSWORD)
-        self.user_password_hash = self._hash_password(config.USER_PASSWORD)
+        self.admin_password_digest, self.user_password_digest = _password_digests(
+            config.ADMIN_PASSWORD, config.USER_PASSWORD, config.AUTH_SALT
+        )
+        self._salt = config.AUTH_SALT.encode()
+        # Кэш: SHA-256 введённого пароля -> роль (только успешные проверки)
+        self._role_cache = OrderedDict()
+        # Счётчик неудачных попыток для сводного предупреждения в лог
+        self._failed_count = 0
+        self._failed_logged_at = float('-inf')
+        # telegram_id -> время последних неудачных попыток (скользящее окно ограничения)
+        self._failure_times: Dict[Optional[int], deque] = OrderedDict()
+        # Проверки идут из пула потоков: кэш и счётчики меняются под блокировкой,
+        # а сам scrypt считается вне её
+        self._lock = threading.Lock()
     
-    def _hash_password(self, password: str) -> str:
-        """Хеширование пароля"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def _hash_password(self, password: bytes) -> bytes:
+        """Хеширование пароля (scrypt с солью из конфигурации)"""
+        return _kdf(password, self._salt)
     
-    def validate_password(self, password: str) -> Optional[str]:
+    def validate_password(self, password: Union[str, bytes],
+                          telegram_id: Optional[int] = None) -> Optional[str]:
         """
         Проверка пароля и возврат роли
         
         Args:
-            password: Введённый пароль
+            password: Введённый пароль (str или уже закодированные UTF-8 bytes)
+            telegram_id: ID пользователя Telegram, чьи неудачи ограничиваются
             
         Returns:
             Роль пользователя или None если пароль неверный
         """
-        password_hash = self._hash_password(password)
+        # Кодируем один раз: результат нужен и для ключа кэша, и для scrypt
+        if isinstance(password, str):
+            password = password.encode()
+        cache_key = hashlib.sha256(password).digest()
+        
+        with self._lock:
+            if self._is_rate_limited(telegram_id):
+                # Пока лимит исчерпан, пароль не проверяется вовсе
+                self._log_failed_attempt()
+                return None
+            role = self._role_cache.get(cache_key)
+            if role is not None:
+                self._role_cache.move_to_end(cache_key)
+        
+        if role is None:
+            candidate = self._hash_password(password)
+            
+            # Оба сравнения выполняются всегда и за постоянное время
+            is_admin = hmac.compare_digest(candidate, self.admin_password_digest)
+            is_user = hmac.compare_digest(candidate, self.user_password_digest)
+            role = _ROLE_BY_MATCH[is_admin << 1 | is_user]
+            
+            with self._lock:
+                if role is None:
+                    # Неудачные попытки не кэшируем, чтобы перебор не раздувал кэш
+                    self._record_failure(telegram_id)
+                    self._log_failed_attempt()
+                    return None
+                
+                self._role_cache[cache_key] = role
+                if len(self._role_cache) > _ROLE_CACHE_SIZE:
+                    self._role_cache.popitem(last=False)
         
-        if password_hash == self.admin_password_hash:
-            logger.info("Успешная аутентификация администратора")
-            return 'admin'
-        elif password_hash == self.user_password_hash:
-            logger.info("Успешная аутентификация пользователя")
-            return 'user'
+        if logger.isEnabledFor(logging.INFO):
+            if role is _ADMIN:
+                logger.info("Успешная аутентификация администратора")
+            else:
+                logger.info("Успешная аутентификация пользователя")
+        return role
+    
+    def _is_rate_limited(self, telegram_id: Optional[int]) -> bool:
+        """Исчерпан ли лимит неудачных попыток пользователя в текущем окне"""
+        failures = self._failure_times.get(telegram_id)
+        return (failures is not None and len(failures) == failures.maxlen and
+                time.monotonic() - failures[0] < _FAILED_WINDOW)
+    
+    def _record_failure(self, telegram_id: Optional[int]):
+        """Запоминание неудачной попытки пользователя"""
+        failures = self._failure_times.get(telegram_id)
+        if failures is None:
+            failures = self._failure_times[telegram_id] = deque(maxlen=_FAILED_LIMIT)
+            if len(self._failure_times) > _FAILED_TRACKED_USERS:
+                self._failure_times.popitem(last=False)
         else:
-            logger.warning("Неудачная попытка аутентификации")
-            return None
+            self._failure_times.move_to_end(telegram_id)
+        failures.append(time.monotonic())
+    
+    def _log_failed_attempt(self):
+        """Сводное логирование неудачных попыток (не чаще раза в интервал)"""
+        self._failed_count += 1
+        now = time.monotonic()
+        if now - self._failed_logged_at < _FAILED_LOG_INTERVAL:
+            return
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(f"Неудачных попыток аутентификации: {self._failed_count}")
+        self._failed_count = 0
+        self._failed_logged_at = now
     
-    def is_admin(self, user_role: str) -> bool:
+    @staticmethod
+    def is_admin(user_role: str) -> bool:
         """Проверка является ли пользователь администратором"""
-        return user_role == 'admin'
+        # == сначала сравнивает указатели, поэтому для интернированных строк
+        # это одна проверка, а для строк из БД - корректное сравнение значений
+        return user_role == _ADMIN
     
-    def can_create_tasks(self, user_role: str) -> bool:
+    @staticmethod
+    def can_create_tasks(user_role: str) -> bool:
         """Проверка может ли пользователь создавать задачи"""
-        return user_role == 'admin'
+        return bool(_ROLE_PERMS.get(user_role, 0) & Permission.CREATE_TASK)
     
-    def can_assign_tasks(self, user_role: str) -> bool:
+    @staticmethod
+    def can_assign_tasks(user_role: str) -> bool:
         """Проверка может ли пользователь назначать задачи"""
-        return user_role == 'admin'
+        return bool(_ROLE_PERMS.get(user_role, 0) & Permission.ASSIGN_TASK)
     
-    def can_modify_task(self, user_role: str, user_id: int, task_creator_id: int, 
-                       task_assignee_id: int) -> bool:
+    @staticmethod
+    def can_modify_task(user_role: str, user_id: int, task_assignee_id: int) -> bool:
         """
         Проверка может ли пользователь модифицировать задачу
         
         Args:
             user_role: Роль пользователя
             user_id: ID пользователя
-            task_creator_id: ID создателя задачи
             task_assignee_id: ID исполнителя задачи
             
         Returns:
             True если может модифицировать
         """
-        # Админ может модифицировать любые задачи
-        if user_role == 'admin':
-            return True
-        
-        # Исполнитель может изменять статус своих задач
-        if user_id == task_assignee_id:
-            return True
-        
-        return False
+        # Исполнитель может менять свои задачи, админ - любые
+        return user_id == task_assignee_id or _ROLE_PERMS.get(user_role, 0) & Permission.MODIFY_ANY != 0
     
-    def can_view_all_tasks(self, user_role: str) -> bool:
+    @staticmethod
+    def can_view_all_tasks(user_role: str) -> bool:
         """Проверка может ли пользователь просматривать все задачи"""
-        return user_role == 'admin'
+        return bool(_ROLE_PERMS.get(user_role, 0) & Permission.VIEW_ALL)
     
-    def can_generate_reports(self, user_role: str) -> bool:
+    @staticmethod
+    def can_generate_reports(user_role: str) -> bool:
         """Проверка может ли пользователь генерировать отчёты"""
-        return user_role == 'admin'
+        return bool(_ROLE_PERMS.get(user_role, 0) & Permission.REPORTS)
     
-    def can_manage_users(self, user_role: str) -> bool:
+    @staticmethod
+    def can_manage_users(user_role: str) -> bool:
         """Проверка может ли пользователь управлять пользователями"""
-        return user_role == 'admin'
+        return bool(_ROLE_PERMS.get(user_role, 0) & Permission.MANAGE_USERS)
 
+# Проверки прав без экземпляра менеджера
+is_admin = AuthManager.is_admin
+can_create_tasks = AuthManager.can_create_tasks
+can_assign_tasks = AuthManager.can_assign_tasks
+can_modify_task = AuthManager.can_modify_task
+can_view_all_tasks = AuthManager.can_view_all_tasks
+can_generate_reports = AuthManager.can_generate_reports
+can_manage_users = AuthManager.can_manage_users
@@ -6,6 +6,15 @@ Telegram бот для управления задачами
 
 import logging
 import asyncio
+import multiprocessing
+import hashlib
+import html
+import os
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from telegram import (
@@ -17,6 +26,7 @@ from telegram import (
 )
 from telegram.ext import (
     Application, 
+    BaseUpdateProcessor,
     CommandHandler, 
     CallbackQueryHandler, 
     MessageHandler, 
@@ -24,11 +34,20 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler
 )
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+
+try:
+    import orjson
+except ImportError:
+    # Не критично: без orjson ответы Telegram разбираются стандартным json
+    orjson = None
 
 from config import config, EMOJIS, TASK_STATUS, TASK_PRIORITY, USER_ROLES
 from database import db
 from auth import AuthManager
-from utils import format_task, format_datetime, validate_deadline, to_utc, get_current_tashkent_time
+from utils import format_task, format_datetime, validate_deadline, to_utc, get_current_tashkent_time, utc_now
 from notifications import NotificationManager
 from reports import ReportGenerator
 
@@ -39,6 +58,280 @@ logger = logging.getLogger(__name__)
  CREATING_TASK_ASSIGNEE, CREATING_TASK_DEADLINE, CREATING_TASK_PRIORITY,
  EDIT_FIELD_SELECT, EDIT_FIELD_INPUT, CONFIRM_CANCEL) = range(9)
 
+class _OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest с разбором ответов Telegram через orjson"""
+    
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> Dict:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # Некорректный UTF-8 и прочие случаи - стандартный разбор PTB
+            return HTTPXRequest.parse_json_payload(payload)
+
+class _PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обновления разных пользователей обрабатываются параллельно, одного - по очереди
+    
+    ConversationHandler хранит состояние диалога на пользователя: два быстрых
+    сообщения, обработанные одновременно, увидели бы одно и то же устаревшее
+    состояние (например, описание сохранилось бы как название). Общий лимит
+    берётся уже после очереди пользователя, поэтому ждущие своей очереди
+    обновления не занимают слоты других пользователей.
+    """
+    
+    __slots__ = ('_limit', '_user_locks', '_user_pending')
+    
+    def __init__(self, max_concurrent_updates: int):
+        # Семафор базового класса берётся до очереди пользователя, поэтому он
+        # заведомо не ограничивает: настоящий лимит - в self._limit
+        super().__init__(2 ** 31 - 1)
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates должно быть положительным")
+        self._limit = asyncio.Semaphore(max_concurrent_updates)
+        # telegram_id -> блокировка и число обновлений, которые её держат или ждут
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._limit:
+                await coroutine
+            return
+        
+        user_id = user.id
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        try:
+            async with lock:
+                async with self._limit:
+                    await coroutine
+        finally:
+            pending = self._user_pending[user_id] - 1
+            if pending:
+                self._user_pending[user_id] = pending
+            else:
+                del self._user_pending[user_id]
+                del self._user_locks[user_id]
+    
+    async def initialize(self) -> None:
+        """Отдельных ресурсов не требуется"""
+    
+    async def shutdown(self) -> None:
+        """Отдельных ресурсов не требуется"""
+
+class _ReplyQueryAdapter:
+    """Подмена CallbackQuery для команд: "редактирование" отправляет новое сообщение"""
+    
+    __slots__ = ('edit_message_text',)
+    
+    def __init__(self, message):
+        self.edit_message_text = message.reply_text
+
+class _RenderDedupQuery:
+    """
+    Обёртка над CallbackQuery: не отправляет правку, если сообщение уже
+    показывает тот же текст с той же клавиатурой
+    
+    Используется и в меню, и на экранах мастера создания задачи.
+    """
+    
+    __slots__ = ('_query', '_user_data')
+    
+    def __init__(self, query, user_data: Dict):
+        self._query = query
+        self._user_data = user_data
+    
+    def __getattr__(self, name):
+        return getattr(self._query, name)
+    
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        message = self._query.message
+        render = (message.message_id, text, reply_markup) if message else None
+        # Клавиатура в обновлении - фактическое состояние сообщения: если его
+        # успел изменить другой обработчик, она не совпадёт и правка уйдёт
+        if (render is not None and self._user_data.get('_last_render') == render
+                and message.reply_markup == reply_markup):
+            return message
+        
+        try:
+            result = await self._query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+        except BadRequest as e:
+            if 'not modified' not in str(e):
+                raise
+            result = message
+        self._user_data['_last_render'] = render
+        return result
+
+# Кэш пользователей: время жизни записи (сек) и максимальный размер
+_USER_CACHE_TTL = 60
+_USER_CACHE_SIZE = 10_000
+# Интервал (сек) между пакетными записями активности пользователей в БД
+_ACTIVITY_FLUSH_INTERVAL = 5
+# Время жизни (сек) кэша списка исполнителей
+_USERS_LIST_TTL = 30
+# Сколько пользователей показывать в управлении и на странице выбора исполнителя
+_USERS_PREVIEW_SIZE = 10
+_REASSIGN_PAGE_SIZE = 20
+# Сколько последних записей истории задачи показывать (лимит длины сообщения)
+_HISTORY_PREVIEW_SIZE = 30
+# Оценка эффективности: (минимальный процент выполнения, текст), по убыванию порога
+_STATS_MSG = (
+    (90, "🏆 <b>Отличная работа!</b>"),
+    (70, "👍 <b>Хорошие результаты!</b>"),
+    (0, "💪 <b>Есть куда стремиться!</b>"),
+)
+# Кнопки отчётов: выполняются в фоне и сами отвечают на CallbackQuery
+_BACKGROUND_ROUTES = frozenset({"gantt_chart", "report_general_excel", "report_my_excel"})
+# Сколько file_id уже отправленных отчётов помнить для повторной отправки
+_FILE_ID_CACHE_SIZE = 256
+# Сколько последних построенных файлов отчётов держать в памяти (на случай сбоя отправки)
+_REPORT_BYTES_CACHE_SIZE = 8
+# Соединений к Bot API: с запасом на параллельные обработчики и рассылку уведомлений
+_CONNECTION_POOL_SIZE = 256
+
+# Постоянные клавиатуры строятся один раз при загрузке модуля
+_ADMIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJIS['create_task']} Создать задачу", callback_data="create_task")],
+    [InlineKeyboardButton(f"{EMOJIS['all_tasks']} Все задачи", callback_data="all_tasks"),
+     InlineKeyboardButton(f"{EMOJIS['my_tasks']} Мои задачи", callback_data="my_tasks")],
+    [InlineKeyboardButton("🔽 Фильтры", callback_data="filters_menu")],
+    [InlineKeyboardButton(f"{EMOJIS['reports']} Отчёты", callback_data="reports"),
+     InlineKeyboardButton(f"{EMOJIS['gantt']} Диаграмма Ганта", callback_data="gantt_chart")],
+    [InlineKeyboardButton(f"{EMOJIS['settings']} Управление пользователями", callback_data="user_management")],
+    [InlineKeyboardButton(f"{EMOJIS['notification']} Настройки", callback_data="user_settings")]
+])
+
+_USER_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJIS['my_tasks']} Мои задачи", callback_data="my_tasks")],
+    [InlineKeyboardButton(f"{EMOJIS['pending']} Активные", callback_data="active_tasks"),
+     InlineKeyboardButton(f"{EMOJIS['done']} Выполненные", callback_data="completed_tasks")],
+    [InlineKeyboardButton("🔽 Фильтры", callback_data="filters_menu")],
+    [InlineKeyboardButton(f"{EMOJIS['reports']} Мой отчёт", callback_data="report_my_excel")],
+    [InlineKeyboardButton(f"{EMOJIS['notification']} Настройки", callback_data="user_settings")]
+])
+
+_FILTERS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Статус: Новая", callback_data="filter_status_new"), InlineKeyboardButton("В работе", callback_data="filter_status_in_progress")],
+    [InlineKeyboardButton("Выполнена", callback_data="filter_status_completed"), InlineKeyboardButton("Просрочена", callback_data="filter_status_overdue")],
+    [InlineKeyboardButton("Приоритет: Высокий", callback_data="filter_priority_high"), InlineKeyboardButton("Средний", callback_data="filter_priority_medium")],
+    [InlineKeyboardButton("Низкий", callback_data="filter_priority_low")],
+    [InlineKeyboardButton(f"{EMOJIS['back']} Назад", callback_data="main_menu")]
+])
+
+_REPORTS_ADMIN_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJIS['excel']} Общий отчёт Excel", callback_data="report_general_excel")],
+    [InlineKeyboardButton(f"{EMOJIS['gantt']} Диаграмма Ганта", callback_data="gantt_chart")],
+    [InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")]
+])
+
+_REPORTS_USER_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJIS['excel']} Мой отчёт Excel", callback_data="report_my_excel")],
+    [InlineKeyboardButton(f"{EMOJIS['chart']} Моя статистика", callback_data="report_my_stats")],
+    [InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")]
+])
+
+_DEADLINE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📅 Через 1 день", callback_data="deadline_1d"),
+     InlineKeyboardButton("📅 Через 3 дня", callback_data="deadline_3d")],
+    [InlineKeyboardButton("📅 Через неделю", callback_data="deadline_7d"),
+     InlineKeyboardButton("📅 Через месяц", callback_data="deadline_30d")],
+    [InlineKeyboardButton("📝 Ввести вручную", callback_data="deadline_manual"),
+     InlineKeyboardButton("⏰ Без дедлайна", callback_data="deadline_none")],
+    [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", callback_data="cancel_create_task")]
+])
+
+# Готовые сроки: callback_data -> число дней от текущего момента
+_DEADLINE_PRESET_DAYS = {"deadline_1d": 1, "deadline_3d": 3, "deadline_7d": 7, "deadline_30d": 30}
+
+_PRIORITY_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJIS['priority_high']} Высокий", callback_data="priority_high")],
+    [InlineKeyboardButton(f"{EMOJIS['priority_medium']} Средний", callback_data="priority_medium")],
+    [InlineKeyboardButton(f"{EMOJIS['priority_low']} Низкий", callback_data="priority_low")],
+    [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", callback_data="cancel_create_task")]
+])
+
+_TASK_CREATED_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJIS['create_task']} Создать ещё", callback_data="create_task")],
+    [InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")]
+])
+
+# Варианты меню смены статуса (администратор): подпись и новый статус
+_STATUS_MENU_OPTIONS = (
+    (f"{EMOJIS['new']} Новая", 'new'),
+    (f"{EMOJIS['pending']} В работе", 'in_progress'),
+    (f"{EMOJIS['done']} Выполнена", 'completed'),
+    (f"{EMOJIS['error']} Отменена", 'cancelled'),
+)
+
+# Переходы статуса, доступные исполнителю задачи: текущий статус -> новые статусы
+_ASSIGNEE_TRANSITIONS = {
+    'new': ('in_progress', 'completed'),
+    'in_progress': ('completed',),
+}
+# Подписи кнопок смены статуса в списке задач и в карточке задачи
+_LIST_ACTION_LABELS = {'in_progress': "🔴 В РАБОТУ", 'completed': "✅ ВЫПОЛНЕНО"}
+_DETAIL_ACTION_LABELS = {'in_progress': "🔴 ВЗЯТЬ В РАБОТУ", 'completed': "✅ ЗАДАЧА ВЫПОЛНЕНА"}
+
+# Шаблоны текстов меню и заголовков списков (parse_mode=ParseMode.HTML)
+_MAIN_MENU_FMT = (
+    "📋 <b>Главное меню</b>\n\n"
+    "👤 {first_name} {last_name}\n"
+    "🎭 Роль: {role}\n\n"
+    "📊 <b>Ваша статистика:</b>\n"
+    "• Всего задач: {total_tasks}\n"
+    "• Выполнено: {completed_tasks}\n"
+    "• Активных: {active_tasks}\n"
+    "• Просрочено: {overdue_tasks}\n"
+)
+_ALL_TASKS_HEADER = "📋 <b>Все задачи</b> (Всего: {})\n\n"
+_MY_TASKS_HEADER = "📝 <b>Мои задачи</b> (Всего: {})\n\n"
+_ACTIVE_TASKS_HEADER = "🕐 <b>Активные задачи</b> (Всего: {})\n\n"
+_COMPLETED_TASKS_HEADER = "✅ <b>Выполненные задачи</b> (Всего: {})\n\n"
+
+# Строка с кнопкой возврата в главное меню
+_MAIN_MENU_ROW = (InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu"),)
+
+# Постоянная клавиатура навигации: клиент показывает её сам, без правок сообщений
+_NAV_MENU = f"{EMOJIS['menu']} Главное меню"
+_NAV_MY_TASKS = f"{EMOJIS['my_tasks']} Мои задачи"
+_NAV_ACTIVE = f"{EMOJIS['pending']} Активные"
+_NAV_COMPLETED = f"{EMOJIS['done']} Выполненные"
+_NAV_FILTERS = "🔽 Фильтры"
+_NAV_SETTINGS = f"{EMOJIS['notification']} Настройки"
+
+_NAV_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [_NAV_MENU, _NAV_MY_TASKS],
+        [_NAV_ACTIVE, _NAV_COMPLETED],
+        [_NAV_FILTERS, _NAV_SETTINGS]
+    ],
+    resize_keyboard=True,
+    is_persistent=True
+)
+
+@lru_cache(maxsize=1024)
+def _list_action_row(task_id: int, status: str) -> tuple:
+    """Строка кнопок смены статуса для списка задач (кнопки неизменяемы, их можно переиспользовать)"""
+    return tuple(
+        InlineKeyboardButton(_LIST_ACTION_LABELS[new_status], callback_data=f"task_status_{task_id}_{new_status}")
+        for new_status in _ASSIGNEE_TRANSITIONS.get(status, ())
+    )
+
+@lru_cache(maxsize=1024)
+def _task_list_row(callback_prefix: str, task_id: int, status: str, priority: str, title: str) -> tuple:
+    """Строка с кнопкой задачи для списка: строится один раз на набор значений"""
+    status_emoji = EMOJIS.get(status, EMOJIS['pending'])
+    priority_emoji = EMOJIS.get(f'priority_{priority}', '')
+    short_title = title if len(title) <= 30 else f"{title[:30]}..."
+    return (InlineKeyboardButton(
+        f"{status_emoji} {priority_emoji} {short_title}",
+        callback_data=f"{callback_prefix}_{task_id}"
+    ),)
+
 class TaskManagerBot:
     """Основной класс Telegram бота для управления задачами"""
     
@@ -47,87 +340,241 @@ class TaskManagerBot:
         self.notification_manager = NotificationManager()
         self.report_generator = ReportGenerator()
         self.user_states = {}  # Состояния пользователей
+        self._user_cache = {}  # telegram_id -> (истекает, запись пользователя)
+        self._activity_buf = {}  # telegram_id -> время последней активности (UTC), ещё не записанное
+        self._users_list_cache = None  # (истекает, активные пользователи, id -> пользователь)
+        self._file_id_cache = {}  # ключ содержимого отчёта -> file_id в Telegram
+        self._report_bytes_cache = {}  # ключ содержимого отчёта -> (имя файла, байты)
+        # Отчёты строятся в отдельных процессах, чтобы не блокировать цикл событий.
+        # Процессы запускаются через spawn, а не fork: пул стартует при первом отчёте,
+        # когда в процессе уже работают потоки (логирование, asyncio.to_thread), и
+        # fork такого процесса может унаследовать чужую захваченную блокировку
+        self._report_executor = ProcessPoolExecutor(
+            max_workers=min(config.MAX_CONCURRENT_REPORTS, os.cpu_count() or 1),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        self._report_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REPORTS)
+        # Фоновые циклы (уведомления, запись активности): ссылки держим до остановки
+        self._background_tasks = []
+        
+        # Маршруты inline-кнопок: точные совпадения callback_data
+        self._exact_routes = {
+            "main_menu": self.show_main_menu,
+            "all_tasks": self.show_all_tasks,
+            "my_tasks": self.show_my_tasks,
+            "active_tasks": self.show_active_tasks,
+            "completed_tasks": self.show_completed_tasks,
+            "reports": self.show_reports_menu,
+            "gantt_chart": self.generate_gantt_chart,
+            "report_general_excel": self.generate_general_excel_report,
+            "report_my_excel": self.generate_my_excel_report,
+            "report_my_stats": self.show_my_stats,
+            "user_management": self.show_user_management,
+            "user_settings": self.show_user_settings,
+            "filters_menu": lambda query, db_user: self.show_filters_menu(query),
+        }
+        # Кнопки постоянной клавиатуры: текст сообщения -> обработчик
+        self._nav_routes = {
+            _NAV_MENU: self.show_main_menu,
+            _NAV_MY_TASKS: self.show_my_tasks,
+            _NAV_ACTIVE: self.show_active_tasks,
+            _NAV_COMPLETED: self.show_completed_tasks,
+            _NAV_FILTERS: lambda query, db_user: self.show_filters_menu(query),
+            _NAV_SETTINGS: self.show_user_settings,
+        }
+        # Листание списков: "<список>_page_<N>" без последнего сегмента -> обработчик
+        self._page_routes = {
+            "task_page": self.show_all_tasks,
+            "my_task_page": self.show_my_tasks,
+            "active_task_page": self.show_active_tasks,
+            "completed_task_page": self.show_completed_tasks,
+        }
+        # Маршруты по префиксу: более длинные префиксы проверяются раньше "task_"
+        self._prefix_routes = (
+            ("task_status_", self.change_task_status),
+            ("task_history_", self.show_task_history),
+            ("task_", self.show_task_detail),
+            ("my_task_", self.show_task_detail),
+            ("active_task_", self.show_task_detail),
+            ("completed_task_", self.show_task_detail),
+            ("reassign_task_", self.handle_reassign_task),
+            ("reassign_page_", self.handle_reassign_task),
+            ("assign_to_", self.handle_assign_to_user),
+            ("change_status_", self.handle_change_status_menu),
+            ("filter_", self.apply_filter),
+            ("edit_task_", self.start_edit_task),
+            ("cancel_task_", self.start_cancel_task),
+            ("confirm_cancel_", self.confirm_cancel_task),
+        )
         
-    def create_main_menu_keyboard(self, user_role: str) -> InlineKeyboardMarkup:
-        """Создание главного меню в зависимости от роли"""
-        keyboard = []
+    async def _get_db_user(self, telegram_id: int) -> Optional[Dict]:
+        """Пользователь по Telegram ID с кэшированием на _USER_CACHE_TTL секунд"""
+        now = time.monotonic()
+        entry = self._user_cache.get(telegram_id)
+        if entry and entry[0] > now:
+            return entry[1]
         
-        if user_role == 'admin':
-            keyboard.extend([
-                [InlineKeyboardButton(f"{EMOJIS['create_task']} Создать задачу", callback_data="create_task")],
-                [InlineKeyboardButton(f"{EMOJIS['all_tasks']} Все задачи", callback_data="all_tasks"),
-                 InlineKeyboardButton(f"{EMOJIS['my_tasks']} Мои задачи", callback_data="my_tasks")],
-                [InlineKeyboardButton("🔽 Фильтры", callback_data="filters_menu")],
-                [InlineKeyboardButton(f"{EMOJIS['reports']} Отчёты", callback_data="reports"),
-                 InlineKeyboardButton(f"{EMOJIS['gantt']} Диаграмма Ганта", callback_data="gantt_chart")],
-                [InlineKeyboardButton(f"{EMOJIS['settings']} Управление пользователями", callback_data="user_management")]
-            ])
+        # Промах кэша: запрос к SQLite уходит в поток, цикл событий не ждёт диск
+        db_user = await asyncio.to_thread(db.get_user_by_telegram_id, telegram_id)
+        if db_user:
+            if len(self._user_cache) >= _USER_CACHE_SIZE:
+                self._user_cache.pop(next(iter(self._user_cache)))
+            self._user_cache[telegram_id] = (now + _USER_CACHE_TTL, db_user)
         else:
-            keyboard.extend([
-                [InlineKeyboardButton(f"{EMOJIS['my_tasks']} Мои задачи", callback_data="my_tasks")],
-                [InlineKeyboardButton(f"{EMOJIS['pending']} Активные", callback_data="active_tasks"),
-                 InlineKeyboardButton(f"{EMOJIS['done']} Выполненные", callback_data="completed_tasks")],
-                [InlineKeyboardButton("🔽 Фильтры", callback_data="filters_menu")],
-                [InlineKeyboardButton(f"{EMOJIS['reports']} Мой отчёт", callback_data="report_my_excel")]
-            ])
-        
-        keyboard.append([InlineKeyboardButton(f"{EMOJIS['notification']} Настройки", callback_data="user_settings")])
-        
-        return InlineKeyboardMarkup(keyboard)
+            self._user_cache.pop(telegram_id, None)
+        return db_user
+    
+    def _invalidate_user(self, telegram_id: int):
+        """Сброс кэша пользователя (после регистрации или смены роли)"""
+        self._user_cache.pop(telegram_id, None)
+        self._users_list_cache = None
+    
+    async def _get_users(self) -> tuple:
+        """Активные пользователи с кэшированием на _USERS_LIST_TTL секунд"""
+        return (await self._load_users_list())[1]
+    
+    async def _get_users_by_id(self) -> Dict[int, Dict]:
+        """Активные пользователи по внутреннему ID (из того же кэша)"""
+        return (await self._load_users_list())[2]
+    
+    async def _load_users_list(self) -> tuple:
+        now = time.monotonic()
+        cached = self._users_list_cache
+        if cached is None or cached[0] <= now:
+            users = tuple(await asyncio.to_thread(db.get_all_users))
+            cached = (now + _USERS_LIST_TTL, users, {u['id']: u for u in users})
+            self._users_list_cache = cached
+        return cached
+    
+    async def _run_report(self, func, *args):
+        """Построение отчёта в пуле процессов (не больше MAX_CONCURRENT_REPORTS одновременно)"""
+        async with self._report_semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._report_executor, func, *args)
+    
+    @staticmethod
+    def _report_key(kind: str, tasks: List[Dict], extra: str = "") -> str:
+        """Ключ содержимого отчёта: меняется при любом изменении задач"""
+        # Хешируются строки задач целиком: updated_at хранится с точностью до
+        # секунды, и две правки в одну секунду по нему не различить
+        digest = hashlib.blake2b(f"{kind}|{extra}".encode(), digest_size=16)
+        for task in tasks:
+            digest.update(repr(tuple(task.values())).encode())
+            digest.update(b"\n")
+        return digest.hexdigest()
+    
+    def _remember_file_id(self, cache_key: str, file_id: str):
+        """Запоминает file_id отправленного отчёта, вытесняя самые старые записи"""
+        if len(self._file_id_cache) >= _FILE_ID_CACHE_SIZE:
+            self._file_id_cache.pop(next(iter(self._file_id_cache)))
+        self._file_id_cache[cache_key] = file_id
+    
+    async def _send_report(self, query, cache_key: str, caption: str, as_photo: bool, build, *args):
+        """
+        Отправка отчёта с переиспользованием уже построенного результата
+        
+        Сначала пробуется file_id прошлой отправки, затем байты недавно построенного
+        файла, и только потом отчёт строится заново в пуле процессов.
+        """
+        reply = query.message.reply_photo if as_photo else query.message.reply_document
+        
+        file_id = self._file_id_cache.get(cache_key)
+        if file_id:
+            try:
+                if as_photo:
+                    await reply(photo=file_id, caption=caption, parse_mode=ParseMode.HTML)
+                else:
+                    await reply(document=file_id, caption=caption, parse_mode=ParseMode.HTML)
+                return
+            except BadRequest as e:
+                # file_id больше не принимается Telegram - отправляем файл заново
+                logger.warning(f"Сохранённый file_id отчёта отклонён: {e}")
+                self._file_id_cache.pop(cache_key, None)
+        
+        cached = self._report_bytes_cache.get(cache_key)
+        if cached is None:
+            path = await self._run_report(build, *args)
+            # Файл читается целиком и сразу закрывается, дескриптор не живёт до отправки
+            cached = (os.path.basename(path), await asyncio.to_thread(Path(path).read_bytes))
+            if len(self._report_bytes_cache) >= _REPORT_BYTES_CACHE_SIZE:
+                self._report_bytes_cache.pop(next(iter(self._report_bytes_cache)))
+            self._report_bytes_cache[cache_key] = cached
+        filename, content = cached
+        
+        if as_photo:
+            message = await reply(photo=content, caption=caption, parse_mode=ParseMode.HTML)
+            file_id = message.photo[-1].file_id
+        else:
+            message = await reply(document=content, filename=filename, caption=caption, parse_mode=ParseMode.HTML)
+            file_id = message.document.file_id
+        self._remember_file_id(cache_key, file_id)
+        # После успешной загрузки файл доступен по file_id, байты больше не нужны
+        self._report_bytes_cache.pop(cache_key, None)
+    
+    def _touch_user_activity(self, telegram_id: int):
+        """Отметка активности: в БД попадёт при следующей пакетной записи"""
+        self._activity_buf[telegram_id] = utc_now().replace(microsecond=0)
+    
+    @staticmethod
+    def _write_user_activity(buf: Dict[int, datetime]):
+        """Запись накопленной активности пользователей одной транзакцией"""
+        try:
+            db.bulk_update_activity(buf)
+        except Exception as e:
+            logger.error(f"Ошибка записи активности пользователей: {e}")
+    
+    def _flush_user_activity(self):
+        """Синхронная запись буфера активности (при остановке)"""
+        buf, self._activity_buf = self._activity_buf, {}
+        if buf:
+            self._write_user_activity(buf)
+    
+    async def _activity_flush_loop(self):
+        """Фоновая пакетная запись активности раз в _ACTIVITY_FLUSH_INTERVAL секунд"""
+        while True:
+            await asyncio.sleep(_ACTIVITY_FLUSH_INTERVAL)
+            # Буфер подменяется в цикле событий, поток получает уже неизменяемую копию
+            buf, self._activity_buf = self._activity_buf, {}
+            if buf:
+                await asyncio.to_thread(self._write_user_activity, buf)
+    
+    def create_main_menu_keyboard(self, user_role: str) -> InlineKeyboardMarkup:
+        """Создание главного меню в зависимости от роли"""
+        return _ADMIN_MENU_MARKUP if user_role == 'admin' else _USER_MENU_MARKUP
     
     def create_filters_keyboard(self) -> InlineKeyboardMarkup:
-        keyboard = [
-            [InlineKeyboardButton("Статус: Новая", callback_data="filter_status_new"), InlineKeyboardButton("В работе", callback_data="filter_status_in_progress")],
-            [InlineKeyboardButton("Выполнена", callback_data="filter_status_completed"), InlineKeyboardButton("Просрочена", callback_data="filter_status_overdue")],
-            [InlineKeyboardButton("Приоритет: Высокий", callback_data="filter_priority_high"), InlineKeyboardButton("Средний", callback_data="filter_priority_medium")],
-            [InlineKeyboardButton("Низкий", callback_data="filter_priority_low")],
-            [InlineKeyboardButton(f"{EMOJIS['back']} Назад", callback_data="main_menu")]
-        ]
-        return InlineKeyboardMarkup(keyboard)
+        return _FILTERS_MARKUP
     
     def create_task_list_keyboard(self, tasks: List[Dict], page: int = 0, 
-                                 callback_prefix: str = "task", user_id: int = None) -> InlineKeyboardMarkup:
-        """Создание клавиатуры со списком задач"""
+                                 callback_prefix: str = "task", user_id: int = None,
+                                 total_count: int = None) -> InlineKeyboardMarkup:
+        """
+        Создание клавиатуры со списком задач
+        
+        Если передан total_count, tasks уже содержит только текущую страницу
+        (пагинация на стороне БД), иначе список режется здесь.
+        """
         keyboard = []
-        start_idx = page * config.MAX_TASKS_PER_PAGE
-        end_idx = start_idx + config.MAX_TASKS_PER_PAGE
-        page_tasks = tasks[start_idx:end_idx]
+        per_page = config.MAX_TASKS_PER_PAGE
+        if total_count is None:
+            total_count = len(tasks)
+            start_idx = page * per_page
+            page_tasks = tasks[start_idx:start_idx + per_page]
+        else:
+            page_tasks = tasks
         
         for task in page_tasks:
-            status_emoji = EMOJIS.get(task['status'], EMOJIS['pending'])
-            priority_emoji = EMOJIS.get(f'priority_{task["priority"]}', '')
-            
-            button_text = f"{status_emoji} {priority_emoji} {task['title'][:30]}..."
-            if len(task['title']) <= 30:
-                button_text = f"{status_emoji} {priority_emoji} {task['title']}"
-            
-            task_row = [InlineKeyboardButton(
-                button_text, 
-                callback_data=f"{callback_prefix}_{task['id']}"
-            )]
-            keyboard.append(task_row)
+            task_id = task['id']
+            status = task['status']
+            keyboard.append(_task_list_row(callback_prefix, task_id, status, task['priority'], task['title']))
             
             if user_id and task['assignee_id'] == user_id:
-                action_buttons = []
-                
-                if task['status'] == 'new':
-                    action_buttons.extend([
-                        InlineKeyboardButton(f"🔴 В РАБОТУ", 
-                                           callback_data=f"task_status_{task['id']}_in_progress"),
-                        InlineKeyboardButton(f"✅ ВЫПОЛНЕНО", 
-                                           callback_data=f"task_status_{task['id']}_completed")
-                    ])
-                elif task['status'] == 'in_progress':
-                    action_buttons.append(
-                        InlineKeyboardButton(f"✅ ВЫПОЛНЕНО", 
-                                           callback_data=f"task_status_{task['id']}_completed")
-                    )
-                
-                if action_buttons:
-                    keyboard.append(action_buttons)
+                action_row = _list_action_row(task_id, status)
+                if action_row:
+                    keyboard.append(action_row)
         
         nav_buttons = []
-        total_pages = (len(tasks) + config.MAX_TASKS_PER_PAGE - 1) // config.MAX_TASKS_PER_PAGE
+        total_pages = -(-total_count // per_page)
         
         if page > 0:
             nav_buttons.append(InlineKeyboardButton(
@@ -144,10 +591,7 @@ class TaskManagerBot:
         if nav_buttons:
             keyboard.append(nav_buttons)
         
-        keyboard.append([InlineKeyboardButton(
-            f"{EMOJIS['menu']} Главное меню", 
-            callback_data="main_menu"
-        )])
+        keyboard.append(_MAIN_MENU_ROW)
         
         return InlineKeyboardMarkup(keyboard)
     
@@ -157,19 +601,10 @@ class TaskManagerBot:
         keyboard = []
         
         if task['assignee_id'] == user_id:
-            if task['status'] == 'new':
-                keyboard.append([
-                    InlineKeyboardButton(f"🔴 ВЗЯТЬ В РАБОТУ", 
-                                       callback_data=f"task_status_{task['id']}_in_progress")
-                ])
+            for new_status in _ASSIGNEE_TRANSITIONS.get(task['status'], ()):
                 keyboard.append([
-                    InlineKeyboardButton(f"✅ ЗАДАЧА ВЫПОЛНЕНА", 
-                                       callback_data=f"task_status_{task['id']}_completed")
-                ])
-            elif task['status'] == 'in_progress':
-                keyboard.append([
-                    InlineKeyboardButton(f"✅ ЗАДАЧА ВЫПОЛНЕНА", 
-                                       callback_data=f"task_status_{task['id']}_completed")
+                    InlineKeyboardButton(_DETAIL_ACTION_LABELS[new_status],
+                                       callback_data=f"task_status_{task['id']}_{new_status}")
                 ])
         
         if user_role == 'admin':
@@ -195,10 +630,11 @@ class TaskManagerBot:
         """Обработчик команды /start"""
         user = update.effective_user
         
-        db_user = db.get_user_by_telegram_id(user.id)
+        db_user = await self._get_db_user(user.id)
         
         if db_user:
-            db.update_user_activity(user.id)
+            self._touch_user_activity(user.id)
+            await update.message.reply_text("⬇️ Быстрая навигация закреплена внизу", reply_markup=_NAV_KEYBOARD)
             welcome_text = (
                 f"🎉 Добро пожаловать обратно, {user.first_name}!\n\n"
                 f"Ваша роль: {USER_ROLES[db_user['role']]} {EMOJIS['admin'] if db_user['role'] == 'admin' else EMOJIS['user']}\n\n"
@@ -233,7 +669,7 @@ class TaskManagerBot:
     
     async def menu_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        db_user = db.get_user_by_telegram_id(user.id)
+        db_user = await self._get_db_user(user.id)
         if not db_user:
             await update.message.reply_text("Используйте /start")
             return
@@ -244,30 +680,50 @@ class TaskManagerBot:
     
     async def my_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        db_user = db.get_user_by_telegram_id(user.id)
+        db_user = await self._get_db_user(user.id)
         if not db_user:
             await update.message.reply_text("Используйте /start")
             return
-        fake_query = type('Q', (), {'edit_message_text': update.message.reply_text})
-        await self.show_my_tasks(fake_query, db_user)
+        await self.show_my_tasks(_ReplyQueryAdapter(update.message), db_user)
+    
+    async def handle_nav_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Нажатие кнопки постоянной клавиатуры навигации"""
+        user = update.effective_user
+        db_user = await self._get_db_user(user.id)
+        if not db_user:
+            await update.message.reply_text("Используйте /start")
+            return
+        self._touch_user_activity(user.id)
+        handler = self._nav_routes[update.message.text]
+        await handler(_ReplyQueryAdapter(update.message), db_user)
+    
+    async def nav_button_during_create_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопка навигации посреди создания задачи: создание прерывается"""
+        context.user_data.pop('creating_task', None)
+        await self.handle_nav_button(update, context)
+        return ConversationHandler.END
     
     async def handle_password(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка ввода пароля"""
         password = update.message.text
         user = update.effective_user
         
-        role = self.auth_manager.validate_password(password)
+        # scrypt занимает ~100 мс CPU: считаем в пуле потоков, не останавливая цикл событий
+        role = await asyncio.to_thread(self.auth_manager.validate_password, password, user.id)
         
         if role:
-            success = db.create_user(
+            success = await asyncio.to_thread(
+                db.create_user,
                 telegram_id=user.id,
                 username=user.username or "",
                 first_name=user.first_name or "",
                 last_name=user.last_name or "",
                 role=role
             )
+            self._invalidate_user(user.id)
             
             if success:
+                await update.message.reply_text("⬇️ Быстрая навигация закреплена внизу", reply_markup=_NAV_KEYBOARD)
                 success_text = (
                     f"✅ Регистрация успешна!\n\n"
                     f"👤 Имя: {user.first_name} {user.last_name or ''}\n"
@@ -294,96 +750,67 @@ class TaskManagerBot:
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на inline кнопки"""
         query = update.callback_query
-        await query.answer()
+        data = query.data
+        background = data in _BACKGROUND_ROUTES
+        if not background:
+            await query.answer(cache_time=1)
         
         user = update.effective_user
-        db_user = db.get_user_by_telegram_id(user.id)
+        db_user = await self._get_db_user(user.id)
         
         if not db_user:
+            if background:
+                await query.answer()
             await query.edit_message_text("❌ Пользователь не найден. Используйте /start")
             return
         
-        db.update_user_activity(user.id)
-        data = query.data
+        self._touch_user_activity(user.id)
+        query = _RenderDedupQuery(query, context.user_data)
         
-        if data == "main_menu":
-            await self.show_main_menu(query, db_user)
-        elif data == "all_tasks":
-            await self.show_all_tasks(query, db_user)
-        elif data == "my_tasks":
-            await self.show_my_tasks(query, db_user)
-        elif data == "active_tasks":
-            await self.show_active_tasks(query, db_user, page=0)
-        elif data == "completed_tasks":
-            await self.show_completed_tasks(query, db_user, page=0)
-        elif data.startswith("task_status_"):
-            await self.change_task_status(query, data, db_user)
-        elif data.startswith("task_"):
-            await self.show_task_detail(query, data, db_user)
-        elif data == "reports":
-            await self.show_reports_menu(query, db_user)
-        elif data == "gantt_chart":
-            await self.generate_gantt_chart(query, db_user)
-        elif data.startswith("task_page_") or data.startswith("my_task_page_") or data.startswith("active_task_page_") or data.startswith("completed_task_page_"):
-            await self.handle_task_page_navigation(query, data, db_user)
-        elif data.startswith("reassign_task_"):
-            await self.handle_reassign_task(query, data, db_user)
-        elif data.startswith("assign_to_"):
-            await self.handle_assign_to_user(query, data, db_user)
-        elif data.startswith("change_status_"):
-            await self.handle_change_status_menu(query, data, db_user)
-        elif data.startswith("task_history_"):
-            await self.show_task_history(query, data, db_user)
-        elif data == "report_general_excel":
-            await self.generate_general_excel_report(query, db_user)
-        elif data == "report_my_excel":
-            await self.generate_my_excel_report(query, db_user)
-        # report_users_stats удалено
-        elif data == "report_my_stats":
-            await self.show_my_stats(query, db_user)
-        elif data == "user_management":
-            await self.show_user_management(query, db_user)
-        elif data == "user_settings":
-            await self.show_user_settings(query, db_user)
-        
-        elif data.startswith("filter_"):
-            await self.apply_filter(query, data, db_user)
-        elif data == "filters_menu":
-            await self.show_filters_menu(query)
-        elif data.startswith("edit_task_"):
-            await self.start_edit_task(query, data, db_user)
-        elif data.startswith("cancel_task_"):
-            await self.start_cancel_task(query, data, db_user)
-        elif data.startswith("confirm_cancel_"):
-            await self.confirm_cancel_task(query, data, db_user)
-        else:
-            await self.show_main_menu(query, db_user)
+        handler = self._exact_routes.get(data)
+        if background:
+            # Отчёт строится долго: не задерживаем обработку остальных обновлений
+            context.application.create_task(handler(query, db_user), update=update)
+            return
+        if handler:
+            await handler(query, db_user)
+            return
+        
+        head, _, tail = data.rpartition("_")
+        page_handler = self._page_routes.get(head)
+        if page_handler:
+            await page_handler(query, db_user, int(tail))
+            return
+        
+        for prefix, handler in self._prefix_routes:
+            if data.startswith(prefix):
+                await handler(query, data, db_user)
+                return
+        
+        await self.show_main_menu(query, db_user)
     
     async def show_main_menu(self, query, db_user):
         """Показать главное меню"""
-        user_stats = db.get_user_stats(db_user['id'])
-        
-        menu_text = (
-            f"📋 **Главное меню**\n\n"
-            f"👤 {db_user['first_name']} {db_user['last_name']}\n"
-            f"🎭 Роль: {USER_ROLES[db_user['role']]}\n\n"
-            f"📊 **Ваша статистика:**\n"
-            f"• Всего задач: {user_stats['total_tasks']}\n"
-            f"• Выполнено: {user_stats['completed_tasks']}\n"
-            f"• Активных: {user_stats['active_tasks']}\n"
-            f"• Просрочено: {user_stats['overdue_tasks']}\n"
+        user_stats = await asyncio.to_thread(db.get_user_stats, db_user['id'])
+        
+        # Имена приходят от пользователей, поэтому экранируются для HTML
+        menu_text = _MAIN_MENU_FMT.format(
+            first_name=html.escape(db_user['first_name'] or ''),
+            last_name=html.escape(db_user['last_name'] or ''),
+            role=USER_ROLES[db_user['role']],
+            **user_stats
         )
         
         await query.edit_message_text(
             menu_text,
             reply_markup=self.create_main_menu_keyboard(db_user['role']),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def show_all_tasks(self, query, db_user, page=0):
-        tasks = db.get_all_tasks()
+        total = await asyncio.to_thread(db.count_tasks)
         
-        if not tasks:
+        if not total:
             await query.edit_message_text(
                 f"{EMOJIS['info']} Задач пока нет.\n\nСоздайте первую задачу!",
                 reply_markup=InlineKeyboardMarkup([[\
@@ -392,21 +819,26 @@ class TaskManagerBot:
             )
             return
         
-        text = f"📋 **Все задачи** (Всего: {len(tasks)})\n\n"
+        per_page = config.MAX_TASKS_PER_PAGE
+        tasks = await asyncio.to_thread(db.get_task_list_page, per_page, page * per_page)
+        text = _ALL_TASKS_HEADER.format(total)
         
         await query.edit_message_text(
             text,
-            reply_markup=self.create_task_list_keyboard(tasks, page, "task", db_user['id'] if db_user['role'] == 'user' else None),
-            parse_mode='Markdown'
+            reply_markup=self.create_task_list_keyboard(tasks, page, "task", db_user['id'] if db_user['role'] == 'user' else None, total),
+            parse_mode=ParseMode.HTML
         )
     
     async def show_my_tasks(self, query, db_user, page=0):
+        per_page = config.MAX_TASKS_PER_PAGE
         if db_user['role'] == 'admin':
-            tasks = db.get_all_tasks()
+            total = await asyncio.to_thread(db.count_tasks)
+            tasks = await asyncio.to_thread(db.get_task_list_page, per_page, page * per_page) if total else []
         else:
-            tasks = db.get_tasks_by_user(db_user['id'])
+            total = await asyncio.to_thread(db.count_tasks, assignee_id=db_user['id'])
+            tasks = await asyncio.to_thread(db.get_task_list_page, per_page, page * per_page, assignee_id=db_user['id']) if total else []
         
-        if not tasks:
+        if not total:
             await query.edit_message_text(
                 f"{EMOJIS['info']} У вас пока нет задач.",
                 reply_markup=InlineKeyboardMarkup([[\
@@ -415,19 +847,19 @@ class TaskManagerBot:
             )
             return
         
-        text = f"📝 **Мои задачи** (Всего: {len(tasks)})\n\n"
+        text = _MY_TASKS_HEADER.format(total)
         
         await query.edit_message_text(
             text,
-            reply_markup=self.create_task_list_keyboard(tasks, page, "my_task", db_user['id']),
-            parse_mode='Markdown'
+            reply_markup=self.create_task_list_keyboard(tasks, page, "my_task", db_user['id'], total),
+            parse_mode=ParseMode.HTML
         )
     
     async def show_active_tasks(self, query, db_user, page=0):
-        tasks = db.get_tasks_by_user(db_user['id'], 'in_progress')
-        tasks.extend(db.get_tasks_by_user(db_user['id'], 'new'))
+        statuses = ('in_progress', 'new')
+        total = await asyncio.to_thread(db.count_tasks, assignee_id=db_user['id'], status=statuses)
         
-        if not tasks:
+        if not total:
             await query.edit_message_text(
                 f"{EMOJIS['info']} У вас нет активных задач.",
                 reply_markup=InlineKeyboardMarkup([[\
@@ -436,18 +868,21 @@ class TaskManagerBot:
             )
             return
         
-        text = f"🕐 **Активные задачи** (Всего: {len(tasks)})\n\n"
+        per_page = config.MAX_TASKS_PER_PAGE
+        tasks = await asyncio.to_thread(db.get_task_list_page, per_page, page * per_page, assignee_id=db_user['id'], status=statuses)
+        text = _ACTIVE_TASKS_HEADER.format(total)
         
         await query.edit_message_text(
             text,
-            reply_markup=self.create_task_list_keyboard(tasks, page, "active_task", db_user['id']),
-            parse_mode='Markdown'
+            reply_markup=self.create_task_list_keyboard(tasks, page, "active_task", db_user['id'], total),
+            parse_mode=ParseMode.HTML
         )
     
     async def show_completed_tasks(self, query, db_user, page=0):
-        tasks = db.get_tasks_by_user(db_user['id'], 'completed')
+        statuses = 'completed'
+        total = await asyncio.to_thread(db.count_tasks, assignee_id=db_user['id'], status=statuses)
         
-        if not tasks:
+        if not total:
             await query.edit_message_text(
                 f"{EMOJIS['info']} У вас нет выполненных задач.",
                 reply_markup=InlineKeyboardMarkup([[\
@@ -456,28 +891,34 @@ class TaskManagerBot:
             )
             return
         
-        text = f"✅ **Выполненные задачи** (Всего: {len(tasks)})\n\n"
+        per_page = config.MAX_TASKS_PER_PAGE
+        tasks = await asyncio.to_thread(db.get_task_list_page, per_page, page * per_page, assignee_id=db_user['id'], status=statuses)
+        text = _COMPLETED_TASKS_HEADER.format(total)
         
         await query.edit_message_text(
             text,
-            reply_markup=self.create_task_list_keyboard(tasks, page, "completed_task", db_user['id']),
-            parse_mode='Markdown'
+            reply_markup=self.create_task_list_keyboard(tasks, page, "completed_task", db_user['id'], total),
+            parse_mode=ParseMode.HTML
         )
     
     async def show_task_detail(self, query, data, db_user):
-        task_id = int(data.split('_')[-1])
-        task = db.get_task_by_id(task_id)
+        task_id = int(data.rpartition('_')[2])
+        task = await asyncio.to_thread(db.get_task_by_id, task_id)
         
         if not task:
             await query.edit_message_text("❌ Задача не найдена.")
             return
         
+        await self._render_task_detail(query, task, db_user)
+    
+    async def _render_task_detail(self, query, task: Dict, db_user):
+        """Показ карточки уже загруженной задачи"""
         text = format_task(task, detailed=True)
         
         await query.edit_message_text(
             text,
             reply_markup=self.create_task_detail_keyboard(task, db_user['role'], db_user['id']),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def start_search(self, query):
@@ -488,8 +929,8 @@ class TaskManagerBot:
     async def handle_search_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         q = update.message.text.strip()
         user = update.effective_user
-        db_user = db.get_user_by_telegram_id(user.id)
-        tasks = db.search_tasks(query_text=q, assignee_id=None if db_user['role']=='admin' else db_user['id'])
+        db_user = await self._get_db_user(user.id)
+        tasks = await asyncio.to_thread(db.search_tasks, query_text=q, assignee_id=None if db_user['role']=='admin' else db_user['id'])
         if not tasks:
             await update.message.reply_text("Ничего не найдено")
             return ConversationHandler.END
@@ -503,9 +944,7 @@ class TaskManagerBot:
         await query.edit_message_text("Выберите фильтры:", reply_markup=self.create_filters_keyboard())
     
     async def apply_filter(self, query, data, db_user):
-        parts = data.split('_')
-        ftype = parts[1]
-        fval = '_'.join(parts[2:])
+        ftype, _, fval = data.removeprefix("filter_").partition("_")
         kwargs = {}
         if ftype == 'status':
             kwargs['status'] = fval
@@ -513,7 +952,7 @@ class TaskManagerBot:
             kwargs['priority'] = fval
         if db_user['role'] == 'user':
             kwargs['assignee_id'] = db_user['id']
-        tasks = db.search_tasks(**kwargs)
+        tasks = await asyncio.to_thread(db.search_tasks, **kwargs)
         if not tasks:
             await query.edit_message_text("По фильтру ничего не найдено", reply_markup=self.create_filters_keyboard())
             return
@@ -523,11 +962,11 @@ class TaskManagerBot:
         )
     
     async def change_task_status(self, query, data, db_user):
-        parts = data.split('_')
-        task_id = int(parts[2])
-        new_status = parts[3]
+        # task_status_<id>_<статус>: статус сам может содержать "_" (in_progress)
+        task_id_str, _, new_status = data.removeprefix("task_status_").partition("_")
+        task_id = int(task_id_str)
         
-        task = db.get_task_by_id(task_id)
+        task = await asyncio.to_thread(db.get_task_by_id, task_id)
         if not task:
             await query.answer("❌ Задача не найдена.")
             return
@@ -536,10 +975,10 @@ class TaskManagerBot:
             await query.answer("❌ У вас нет прав для изменения этой задачи.")
             return
         
-        old_status = task['status']
-        success = db.update_task_status(task_id, new_status, db_user['id'])
+        updated_task = await asyncio.to_thread(db.update_task_status_and_fetch, task_id, new_status, db_user['id'])
         
-        if success:
+        if updated_task:
+            old_status = updated_task['old_status']
             if new_status == 'completed':
                 await query.answer("🎉 Отлично! Задача выполнена!")
             elif new_status == 'in_progress':
@@ -549,43 +988,39 @@ class TaskManagerBot:
             
             if task['creator_id'] != db_user['id']:
                 try:
-                    all_users = db.get_all_users()
-                    creator = None
-                    for user in all_users:
-                        if user['id'] == task['creator_id']:
-                            creator = user
-                            break
+                    # telegram_id создателя уже пришёл из JOIN вместе с задачей
+                    creator_telegram_id = updated_task['creator_telegram_id']
                     
-                    if creator:
-                        updated_task = db.get_task_by_id(task_id)
+                    if creator_telegram_id:
                         await self.notification_manager.notify_task_status_changed(
-                            updated_task, old_status, new_status, creator['telegram_id']
+                            updated_task, old_status, new_status, creator_telegram_id
                         )
                         if new_status == 'completed':
+                            assignee_name = html.escape(f"{db_user['first_name']} {db_user['last_name']}")
                             completion_message = (
-                                f"🎉 **ЗАДАЧА ВЫПОЛНЕНА!**\n\n"
-                                f"📝 **Задача:** {updated_task['title']}\n"
-                                f"👤 **Исполнитель:** {db_user['first_name']} {db_user['last_name']}\n"
-                                f"⏰ **Время выполнения:** {format_datetime(get_current_tashkent_time())}\n"
-                                f"📊 **Статус:** {TASK_STATUS[new_status]}\n\n"
+                                f"🎉 <b>ЗАДАЧА ВЫПОЛНЕНА!</b>\n\n"
+                                f"📝 <b>Задача:</b> {html.escape(updated_task['title'])}\n"
+                                f"👤 <b>Исполнитель:</b> {assignee_name}\n"
+                                f"⏰ <b>Время выполнения:</b> {format_datetime(get_current_tashkent_time())}\n"
+                                f"📊 <b>Статус:</b> {TASK_STATUS[new_status]}\n\n"
                                 f"Отличная работа! 👏"
                             )
                             await self.notification_manager.send_notification(
-                                creator['telegram_id'], completion_message, task_id
+                                creator_telegram_id, completion_message, task_id
                             )
                 except Exception as e:
                     logger.error(f"Ошибка при отправке уведомления: {e}")
-            await self.show_task_detail(query, f"task_{task_id}", db_user)
+            await self._render_task_detail(query, updated_task, db_user)
         else:
             await query.answer("❌ Ошибка при изменении статуса.")
     
     async def start_create_task(self, query, context):
         text = (
-            f"{EMOJIS['create_task']} **Создание новой задачи**\n\n"
+            f"{EMOJIS['create_task']} <b>Создание новой задачи</b>\n\n"
             f"Введите название задачи (до {config.MAX_TASK_TITLE_LENGTH} символов):"
         )
         
-        await query.edit_message_text(text, parse_mode='Markdown')
+        await query.edit_message_text(text, parse_mode=ParseMode.HTML)
         context.user_data['creating_task'] = {}
         return CREATING_TASK_TITLE
     
@@ -602,12 +1037,12 @@ class TaskManagerBot:
         context.user_data['creating_task']['title'] = title
         
         text = (
-            f"✅ **Название:** {title}\n\n"
+            f"✅ <b>Название:</b> {html.escape(title)}\n\n"
             f"Теперь введите описание задачи (до {config.MAX_TASK_DESCRIPTION_LENGTH} символов)\n"
             f"или отправьте '-' чтобы пропустить:"
         )
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
         return CREATING_TASK_DESCRIPTION
     
     async def handle_task_description(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -624,7 +1059,7 @@ class TaskManagerBot:
         
         context.user_data['creating_task']['description'] = description
         
-        users = db.get_all_users()
+        users = await self._get_users()
         if not users:
             await update.message.reply_text(f"{EMOJIS['error']} Нет доступных исполнителей!")
             return ConversationHandler.END
@@ -641,20 +1076,20 @@ class TaskManagerBot:
         keyboard.append([InlineKeyboardButton(f"{EMOJIS['back']} Отмена", callback_data="cancel_create_task")])
         
         text = (
-            f"✅ **Название:** {context.user_data['creating_task']['title']}\n"
-            f"✅ **Описание:** {context.user_data['creating_task']['description'] or 'Не указано'}\n\n"
-            f"👤 **Выберите исполнителя:**"
+            f"✅ <b>Название:</b> {html.escape(context.user_data['creating_task']['title'])}\n"
+            f"✅ <b>Описание:</b> {html.escape(context.user_data['creating_task']['description'] or 'Не указано')}\n\n"
+            f"👤 <b>Выберите исполнителя:</b>"
         )
         
         await update.message.reply_text(
             text, 
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
         return CREATING_TASK_ASSIGNEE
     
     async def handle_task_assignee(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        query = update.callback_query
+        query = _RenderDedupQuery(update.callback_query, context.user_data)
         await query.answer()
         
         if query.data == "cancel_create_task":
@@ -662,43 +1097,29 @@ class TaskManagerBot:
             return ConversationHandler.END
         
         if query.data.startswith("assign_user_"):
-            assignee_id = int(query.data.split("_")[-1])
+            assignee_id = int(query.data.rpartition("_")[2])
             context.user_data['creating_task']['assignee_id'] = assignee_id
             
-            assignee = None
-            for user in db.get_all_users():
-                if user['id'] == assignee_id:
-                    assignee = user
-                    break
-            
-            keyboard = [
-                [InlineKeyboardButton("📅 Через 1 день", callback_data="deadline_1d"),
-                 InlineKeyboardButton("📅 Через 3 дня", callback_data="deadline_3d")],
-                [InlineKeyboardButton("📅 Через неделю", callback_data="deadline_7d"),
-                 InlineKeyboardButton("📅 Через месяц", callback_data="deadline_30d")],
-                [InlineKeyboardButton("📝 Ввести вручную", callback_data="deadline_manual"),
-                 InlineKeyboardButton("⏰ Без дедлайна", callback_data="deadline_none")],
-                [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", callback_data="cancel_create_task")]
-            ]
+            assignee = (await self._get_users_by_id()).get(assignee_id) or await asyncio.to_thread(db.get_user_by_id, assignee_id)
             
             assignee_name = f"{assignee['first_name']} {assignee['last_name']}" if assignee else "Неизвестен"
             
             text = (
-                f"✅ **Название:** {context.user_data['creating_task']['title']}\n"
-                f"✅ **Описание:** {context.user_data['creating_task']['description'] or 'Не указано'}\n"
-                f"✅ **Исполнитель:** {assignee_name}\n\n"
-                f"⏰ **Выберите дедлайн:**"
+                f"✅ <b>Название:</b> {html.escape(context.user_data['creating_task']['title'])}\n"
+                f"✅ <b>Описание:</b> {html.escape(context.user_data['creating_task']['description'] or 'Не указано')}\n"
+                f"✅ <b>Исполнитель:</b> {html.escape(assignee_name)}\n\n"
+                f"⏰ <b>Выберите дедлайн:</b>"
             )
             
             await query.edit_message_text(
                 text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
+                reply_markup=_DEADLINE_MARKUP,
+                parse_mode=ParseMode.HTML
             )
             return CREATING_TASK_DEADLINE
     
     async def handle_task_deadline(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        query = update.callback_query
+        query = _RenderDedupQuery(update.callback_query, context.user_data)
         await query.answer()
         
         if query.data == "cancel_create_task":
@@ -706,52 +1127,24 @@ class TaskManagerBot:
             return ConversationHandler.END
         
         deadline = None
-        if query.data == "deadline_1d":
-            deadline = to_utc(get_current_tashkent_time() + timedelta(days=1))
-        elif query.data == "deadline_3d":
-            deadline = to_utc(get_current_tashkent_time() + timedelta(days=3))
-        elif query.data == "deadline_7d":
-            deadline = to_utc(get_current_tashkent_time() + timedelta(days=7))
-        elif query.data == "deadline_30d":
-            deadline = to_utc(get_current_tashkent_time() + timedelta(days=30))
-        elif query.data == "deadline_none":
-            deadline = None
+        days = _DEADLINE_PRESET_DAYS.get(query.data)
+        if days is not None:
+            # Сдвиг на целые сутки не зависит от пояса: считаем сразу в UTC (в БД - naive UTC)
+            deadline = utc_now() + timedelta(days=days)
         elif query.data == "deadline_manual":
             text = (
-                f"📅 **Введите дедлайн в формате:**\n"
-                f"• `25.12.2024 18:00`\n"
-                f"• `25.12.2024`\n"
-                f"• `завтра`\n"
-                f"• `через 5 дней`\n"
-                f"• `через 2 часа`"
+                f"📅 <b>Введите дедлайн в формате:</b>\n"
+                f"• <code>25.12.2024 18:00</code>\n"
+                f"• <code>25.12.2024</code>\n"
+                f"• <code>завтра</code>\n"
+                f"• <code>через 5 дней</code>\n"
+                f"• <code>через 2 часа</code>"
             )
-            await query.edit_message_text(text, parse_mode='Markdown')
+            await query.edit_message_text(text, parse_mode=ParseMode.HTML)
             return CREATING_TASK_DEADLINE
         
         context.user_data['creating_task']['deadline'] = deadline
-        
-        keyboard = [
-            [InlineKeyboardButton(f"{EMOJIS['priority_high']} Высокий", callback_data="priority_high")],
-            [InlineKeyboardButton(f"{EMOJIS['priority_medium']} Средний", callback_data="priority_medium")],
-            [InlineKeyboardButton(f"{EMOJIS['priority_low']} Низкий", callback_data="priority_low")],
-            [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", callback_data="cancel_create_task")]
-        ]
-        
-        deadline_text = format_datetime(deadline) if deadline else "Не указан"
-        
-        text = (
-            f"✅ **Название:** {context.user_data['creating_task']['title']}\n"
-            f"✅ **Описание:** {context.user_data['creating_task']['description'] or 'Не указано'}\n"
-            f"✅ **Дедлайн:** {deadline_text}\n\n"
-            f"🔥 **Выберите приоритет:**"
-        )
-        
-        await query.edit_message_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
-        return CREATING_TASK_PRIORITY
+        return await self._render_priority_screen(context, query.edit_message_text)
     
     async def handle_manual_deadline(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         deadline_str = update.message.text.strip()
@@ -761,41 +1154,41 @@ class TaskManagerBot:
             await update.message.reply_text(
                 f"{EMOJIS['error']} Неверный формат даты!\n\n"
                 f"Попробуйте:\n"
-                f"• `25.12.2024 18:00`\n"
-                f"• `25.12.2024`\n"
-                f"• `завтра`\n"
-                f"• `через 5 дней`",
-                parse_mode='Markdown'
+                f"• <code>25.12.2024 18:00</code>\n"
+                f"• <code>25.12.2024</code>\n"
+                f"• <code>завтра</code>\n"
+                f"• <code>через 5 дней</code>",
+                parse_mode=ParseMode.HTML
             )
             return CREATING_TASK_DEADLINE
         
         context.user_data['creating_task']['deadline'] = to_utc(deadline)
-        
-        keyboard = [
-            [InlineKeyboardButton(f"{EMOJIS['priority_high']} Высокий", callback_data="priority_high")],
-            [InlineKeyboardButton(f"{EMOJIS['priority_medium']} Средний", callback_data="priority_medium")],
-            [InlineKeyboardButton(f"{EMOJIS['priority_low']} Низкий", callback_data="priority_low")],
-            [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", callback_data="cancel_create_task")]
-        ]
-        
-        deadline_text = format_datetime(deadline)
+        return await self._render_priority_screen(context, update.message.reply_text)
+    
+    async def _render_priority_screen(self, context: ContextTypes.DEFAULT_TYPE, send) -> int:
+        """
+        Экран выбора приоритета при создании задачи
+        
+        Args:
+            context: Контекст с данными создаваемой задачи (дедлайн уже в UTC)
+            send: query.edit_message_text или update.message.reply_text
+        """
+        creating_task = context.user_data['creating_task']
+        deadline = creating_task['deadline']
+        deadline_text = format_datetime(deadline) if deadline else "Не указан"
         
         text = (
-            f"✅ **Название:** {context.user_data['creating_task']['title']}\n"
-            f"✅ **Описание:** {context.user_data['creating_task']['description'] or 'Не указано'}\n"
-            f"✅ **Дедлайн:** {deadline_text}\n\n"
-            f"🔥 **Выберите приоритет:**"
+            f"✅ <b>Название:</b> {html.escape(creating_task['title'])}\n"
+            f"✅ <b>Описание:</b> {html.escape(creating_task['description'] or 'Не указано')}\n"
+            f"✅ <b>Дедлайн:</b> {deadline_text}\n\n"
+            f"🔥 <b>Выберите приоритет:</b>"
         )
         
-        await update.message.reply_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
+        await send(text, reply_markup=_PRIORITY_MARKUP, parse_mode=ParseMode.HTML)
         return CREATING_TASK_PRIORITY
     
     async def handle_task_priority(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        query = update.callback_query
+        query = _RenderDedupQuery(update.callback_query, context.user_data)
         await query.answer()
         
         if query.data == "cancel_create_task":
@@ -810,10 +1203,12 @@ class TaskManagerBot:
         priority = priority_map.get(query.data, "medium")
         
         user = update.effective_user
-        db_user = db.get_user_by_telegram_id(user.id)
+        db_user = await self._get_db_user(user.id)
         
         try:
-            task_id = db.create_task(
+            # Создание, история и чтение задачи - одна транзакция и один COMMIT
+            task = await asyncio.to_thread(
+                db.create_task_with_history,
                 title=context.user_data['creating_task']['title'],
                 description=context.user_data['creating_task']['description'],
                 creator_id=db_user['id'],
@@ -822,32 +1217,19 @@ class TaskManagerBot:
                 deadline=context.user_data['creating_task']['deadline']
             )
             
-            if context.user_data['creating_task']['assignee_id']:
-                assignee = None
-                for user_data in db.get_all_users():
-                    if user_data['id'] == context.user_data['creating_task']['assignee_id']:
-                        assignee = user_data
-                        break
-                
-                if assignee:
-                    task = db.get_task_by_id(task_id)
-                    await self.notification_manager.notify_task_assigned(task, assignee['telegram_id'])
+            # Задача уже содержит telegram_id исполнителя: отдельный поиск пользователя не нужен
+            if task['assignee_telegram_id']:
+                await self.notification_manager.notify_task_assigned(task, task['assignee_telegram_id'])
             
-            task = db.get_task_by_id(task_id)
             success_text = (
-                f"{EMOJIS['success']} **Задача создана успешно!**\n\n"
+                f"{EMOJIS['success']} <b>Задача создана успешно!</b>\n\n"
                 f"{format_task(task, detailed=True)}"
             )
             
-            keyboard = [
-                [InlineKeyboardButton(f"{EMOJIS['create_task']} Создать ещё", callback_data="create_task")],
-                [InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")]
-            ]
-            
             await query.edit_message_text(
                 success_text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
+                reply_markup=_TASK_CREATED_MARKUP,
+                parse_mode=ParseMode.HTML
             )
             
         except Exception as e:
@@ -860,72 +1242,51 @@ class TaskManagerBot:
         return ConversationHandler.END
     
     async def show_reports_menu(self, query, db_user):
-        keyboard = []
-        
-        if db_user['role'] == 'admin':
-            keyboard.extend([
-                [InlineKeyboardButton(f"{EMOJIS['excel']} Общий отчёт Excel", callback_data="report_general_excel")],
-                [InlineKeyboardButton(f"{EMOJIS['gantt']} Диаграмма Ганта", callback_data="gantt_chart")]
-            ])
-        else:
-            keyboard.extend([
-                [InlineKeyboardButton(f"{EMOJIS['excel']} Мой отчёт Excel", callback_data="report_my_excel")],
-                [InlineKeyboardButton(f"{EMOJIS['chart']} Моя статистика", callback_data="report_my_stats")]
-            ])
-        
-        keyboard.append([InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")])
+        markup = _REPORTS_ADMIN_MARKUP if db_user['role'] == 'admin' else _REPORTS_USER_MARKUP
         
         await query.edit_message_text(
-            f"{EMOJIS['reports']} **Отчёты и аналитика**\n\nВыберите тип отчёта:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            f"{EMOJIS['reports']} <b>Отчёты и аналитика</b>\n\nВыберите тип отчёта:",
+            reply_markup=markup,
+            parse_mode=ParseMode.HTML
         )
     
     async def generate_gantt_chart(self, query, db_user):
-        await query.answer("📊 Генерирую диаграмму Ганта...")
+        await query.answer("⏳ Готовлю диаграмму Ганта…")
         
         try:
-            tasks = db.get_all_tasks()
-            chart_path = self.report_generator.create_gantt_chart(tasks)
+            tasks = await asyncio.to_thread(db.get_all_tasks)
+            caption = f"{EMOJIS['gantt']} <b>Диаграмма Ганта</b>\n\nАктуальное состояние всех задач проекта"
+            # Незавершённые задачи тянутся до текущего момента, поэтому ключ живёт не дольше часа
+            cache_key = self._report_key('gantt', tasks, get_current_tashkent_time().strftime('%Y%m%d%H'))
             
-            await query.message.reply_photo(
-                photo=open(chart_path, 'rb'),
-                caption=f"{EMOJIS['gantt']} **Диаграмма Ганта**\n\nАктуальное состояние всех задач проекта",
-                parse_mode='Markdown'
-            )
+            await self._send_report(query, cache_key, caption, True,
+                                    self.report_generator.create_gantt_chart, tasks)
         except Exception as e:
             logger.error(f"Ошибка при генерации диаграммы Ганта: {e}")
             await query.message.reply_text(f"{EMOJIS['error']} Ошибка при генерации диаграммы.")
     
-    async def handle_task_page_navigation(self, query, data, db_user):
-        parts = data.split("_")
-        page = int(parts[-1])
-        
-        if data.startswith("task_page_"):
-            await self.show_all_tasks(query, db_user, page)
-        elif data.startswith("my_task_page_"):
-            await self.show_my_tasks(query, db_user, page)
-        elif data.startswith("active_task_page_"):
-            await self.show_active_tasks(query, db_user, page)
-        elif data.startswith("completed_task_page_"):
-            await self.show_completed_tasks(query, db_user, page)
-    
     async def handle_reassign_task(self, query, data, db_user):
         if db_user['role'] != 'admin':
             await query.answer("❌ Недостаточно прав")
             return
         
-        task_id = int(data.split("_")[-1])
-        task = db.get_task_by_id(task_id)
+        if data.startswith("reassign_page_"):
+            task_id_str, _, page_str = data.removeprefix("reassign_page_").partition("_")
+            task_id, page = int(task_id_str), int(page_str)
+        else:
+            task_id, page = int(data.rpartition("_")[2]), 0
+        task = await asyncio.to_thread(db.get_task_by_id, task_id)
         
         if not task:
             await query.edit_message_text("❌ Задача не найдена")
             return
         
-        users = db.get_all_users()
+        # Страница берётся из кэша списка пользователей, а не из отдельного запроса
+        users = await self._get_users()
+        start = page * _REASSIGN_PAGE_SIZE
         keyboard = []
         
-        for user in users:
+        for user in users[start:start + _REASSIGN_PAGE_SIZE]:
             user_name = f"{user['first_name']} {user['last_name']}"
             role_emoji = EMOJIS['admin'] if user['role'] == 'admin' else EMOJIS['user']
             keyboard.append([InlineKeyboardButton(
@@ -933,14 +1294,26 @@ class TaskManagerBot:
                 callback_data=f"assign_to_{user['id']}_{task_id}"
             )])
         
+        nav_buttons = []
+        if page > 0:
+            nav_buttons.append(InlineKeyboardButton(
+                f"{EMOJIS['back']} Назад", callback_data=f"reassign_page_{task_id}_{page - 1}"
+            ))
+        if start + _REASSIGN_PAGE_SIZE < len(users):
+            nav_buttons.append(InlineKeyboardButton(
+                f"Далее {EMOJIS['next']}", callback_data=f"reassign_page_{task_id}_{page + 1}"
+            ))
+        if nav_buttons:
+            keyboard.append(nav_buttons)
+        
         keyboard.append([InlineKeyboardButton(f"{EMOJIS['back']} Назад", callback_data=f"task_{task_id}")])
         
-        text = f"👤 **Переназначить задачу:**\n\n{task['title']}\n\nВыберите нового исполнителя:"
+        text = f"👤 <b>Переназначить задачу:</b>\n\n{html.escape(task['title'])}\n\nВыберите нового исполнителя:"
         
         await query.edit_message_text(
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def handle_assign_to_user(self, query, data, db_user):
@@ -948,26 +1321,26 @@ class TaskManagerBot:
             await query.answer("❌ Недостаточно прав")
             return
         
-        parts = data.split("_")
-        new_assignee_id = int(parts[2])
-        task_id = int(parts[3])
+        assignee_id_str, _, task_id_str = data.removeprefix("assign_to_").partition("_")
+        new_assignee_id, task_id = int(assignee_id_str), int(task_id_str)
         
-        success = db.assign_task(task_id, new_assignee_id, db_user['id'])
+        success = await asyncio.to_thread(db.assign_task, task_id, new_assignee_id, db_user['id'])
         
         if success:
-            task = db.get_task_by_id(task_id)
+            task = await asyncio.to_thread(db.get_task_by_id, task_id)
             
             if task['assignee_telegram_id']:
                 await self.notification_manager.notify_task_assigned(task, task['assignee_telegram_id'])
             
             await query.answer("✅ Задача переназначена!")
-            await self.show_task_detail(query, f"task_{task_id}", db_user)
+            # Задача уже прочитана выше: повторный запрос через show_task_detail не нужен
+            await self._render_task_detail(query, task, db_user)
         else:
             await query.answer("❌ Ошибка при переназначении задачи")
     
     async def handle_change_status_menu(self, query, data, db_user):
-        task_id = int(data.split("_")[-1])
-        task = db.get_task_by_id(task_id)
+        task_id = int(data.rpartition("_")[2])
+        task = await asyncio.to_thread(db.get_task_by_id, task_id)
         
         if not task:
             await query.edit_message_text("❌ Задача не найдена")
@@ -978,46 +1351,46 @@ class TaskManagerBot:
             return
         
         keyboard = [
-            [InlineKeyboardButton(f"{EMOJIS['new']} Новая", callback_data=f"task_status_{task_id}_new")],
-            [InlineKeyboardButton(f"{EMOJIS['pending']} В работе", callback_data=f"task_status_{task_id}_in_progress")],
-            [InlineKeyboardButton(f"{EMOJIS['done']} Выполнена", callback_data=f"task_status_{task_id}_completed")],
-            [InlineKeyboardButton(f"{EMOJIS['error']} Отменена", callback_data=f"task_status_{task_id}_cancelled")],
-            [InlineKeyboardButton(f"{EMOJIS['back']} Назад", callback_data=f"task_{task_id}")]
+            [InlineKeyboardButton(label, callback_data=f"task_status_{task_id}_{status}")]
+            for label, status in _STATUS_MENU_OPTIONS
         ]
+        keyboard.append([InlineKeyboardButton(f"{EMOJIS['back']} Назад", callback_data=f"task_{task_id}")])
         
-        text = f"📊 **Изменить статус задачи:**\n\n{task['title']}\n\nТекущий статус: {TASK_STATUS[task['status']]}"
+        text = f"📊 <b>Изменить статус задачи:</b>\n\n{html.escape(task['title'])}\n\nТекущий статус: {TASK_STATUS[task['status']]}"
         
         await query.edit_message_text(
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def show_task_history(self, query, data, db_user):
-        task_id = int(data.split("_")[-1])
-        task = db.get_task_by_id(task_id)
+        task_id = int(data.rpartition("_")[2])
+        task = await asyncio.to_thread(db.get_task_by_id, task_id)
         
         if not task:
             await query.edit_message_text("❌ Задача не найдена")
             return
         
-        history = db.get_task_history(task_id)
-        
-        text = f"📋 **История задачи:** {task['title']}\n\n"
+        # Генератор и islice ленивые: чтение начнётся и закончится в рабочем потоке
+        history = await asyncio.to_thread(
+            list, islice(db.iter_task_history(task_id), _HISTORY_PREVIEW_SIZE)
+        )
         
-        if history:
-            for entry in history:
-                action_time = format_datetime(entry['created_at'])
-                text += f"🕐 {action_time}\n👤 {entry['user_name']}\n📝 {entry['action']}\n\n"
-        else:
-            text += "История пуста"
+        entries = "\n\n".join(
+            f"🕐 {format_datetime(entry['created_at'])}\n👤 {html.escape(entry['user_name'] or '')}\n📝 {html.escape(entry['action'])}"
+            for entry in history
+        )
+        text = f"📋 <b>История задачи:</b> {html.escape(task['title'])}\n\n{entries or 'История пуста'}"
+        if len(history) == _HISTORY_PREVIEW_SIZE:
+            text += f"\n\n<i>Показаны последние {_HISTORY_PREVIEW_SIZE} изменений</i>"
         
         keyboard = [[InlineKeyboardButton(f"{EMOJIS['back']} Назад", callback_data=f"task_{task_id}")]]
         
         await query.edit_message_text(
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def generate_general_excel_report(self, query, db_user):
@@ -1025,39 +1398,35 @@ class TaskManagerBot:
             await query.answer("❌ Недостаточно прав")
             return
         
-        await query.answer("📊 Генерирую отчёт...")
+        await query.answer("⏳ Готовлю отчёт…")
         
         try:
-            tasks = db.get_all_tasks()
-            report_path = self.report_generator.create_excel_report(tasks)
+            tasks = await asyncio.to_thread(db.get_all_tasks)
+            caption = f"{EMOJIS['excel']} <b>Общий отчёт по задачам</b>\n\nВсего задач: {len(tasks)}"
+            cache_key = self._report_key('general_excel', tasks)
             
-            await query.message.reply_document(
-                document=open(report_path, 'rb'),
-                caption=f"{EMOJIS['excel']} **Общий отчёт по задачам**\n\nВсего задач: {len(tasks)}",
-                parse_mode='Markdown'
-            )
+            await self._send_report(query, cache_key, caption, False,
+                                    self.report_generator.create_excel_report, tasks)
         except Exception as e:
             logger.error(f"Ошибка при генерации Excel отчёта: {e}")
             await query.message.reply_text(f"{EMOJIS['error']} Ошибка при генерации отчёта")
     
     async def generate_my_excel_report(self, query, db_user):
-        await query.answer("📊 Генерирую ваш отчёт...")
+        await query.answer("⏳ Готовлю ваш отчёт…")
         
         try:
-            tasks = db.get_tasks_by_user(db_user['id'])
+            tasks = await asyncio.to_thread(db.get_tasks_by_user, db_user['id'])
             
             if not tasks:
                 await query.message.reply_text("📝 У вас пока нет задач для отчёта")
                 return
             
+            caption = f"{EMOJIS['excel']} <b>Ваш личный отчёт</b>\n\nВаши задачи: {len(tasks)}"
+            cache_key = self._report_key('my_excel', tasks, str(db_user['id']))
             filename = f"my_tasks_report_{get_current_tashkent_time().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            report_path = self.report_generator.create_excel_report(tasks, filename)
             
-            await query.message.reply_document(
-                document=open(report_path, 'rb'),
-                caption=f"{EMOJIS['excel']} **Ваш личный отчёт**\n\nВаши задачи: {len(tasks)}",
-                parse_mode='Markdown'
-            )
+            await self._send_report(query, cache_key, caption, False,
+                                    self.report_generator.create_excel_report, tasks, filename)
         except Exception as e:
             logger.error(f"Ошибка при генерации личного Excel отчёта: {e}")
             await query.message.reply_text(f"{EMOJIS['error']} Ошибка при генерации отчёта")
@@ -1065,33 +1434,31 @@ class TaskManagerBot:
     # Метод show_users_stats удалён по запросу
     
     async def show_my_stats(self, query, db_user):
-        stats = db.get_user_stats(db_user['id'])
+        stats = await asyncio.to_thread(db.get_user_stats, db_user['id'])
         
-        completion_rate = (stats['completed_tasks'] / max(stats['total_tasks'], 1)) * 100
+        total = max(stats['total_tasks'], 1)
+        completion_rate = stats['completed_tasks'] * 100 / total
+        # Порог сравнивается в целых числах, дробный процент нужен только для вывода
+        verdict = next(msg for threshold, msg in _STATS_MSG
+                       if stats['completed_tasks'] * 100 >= threshold * total)
         
         text = (
-            f"{EMOJIS['chart']} **Ваша статистика**\n\n"
-            f"📊 **Общие показатели:**\n"
+            f"{EMOJIS['chart']} <b>Ваша статистика</b>\n\n"
+            f"📊 <b>Общие показатели:</b>\n"
             f"• Всего задач: {stats['total_tasks']}\n"
             f"• Выполнено: {stats['completed_tasks']}\n"
             f"• Активных: {stats['active_tasks']}\n"
             f"• Просрочено: {stats['overdue_tasks']}\n\n"
-            f"📈 **Эффективность:** {completion_rate:.1f}%\n\n"
+            f"📈 <b>Эффективность:</b> {completion_rate:.1f}%\n\n"
+            f"{verdict}"
         )
         
-        if completion_rate >= 90:
-            text += f"🏆 **Отличная работа!**"
-        elif completion_rate >= 70:
-            text += f"👍 **Хорошие результаты!**"
-        else:
-            text += f"💪 **Есть куда стремиться!**"
-        
         keyboard = [[InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")]]
         
         await query.edit_message_text(
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def show_user_management(self, query, db_user):
@@ -1099,24 +1466,29 @@ class TaskManagerBot:
             await query.answer("❌ Недостаточно прав")
             return
         
-        users = db.get_all_users()
-        general_stats = db.get_general_stats()
-        
-        text = (
-            f"{EMOJIS['admin']} **Управление пользователями**\n\n"
-            f"👥 **Всего пользователей:** {general_stats['total_users']}\n"
-            f"📋 **Всего задач:** {general_stats['total_tasks']}\n"
-            f"✅ **Выполнено:** {general_stats['completed_tasks']}\n"
-            f"🔴 **Просрочено:** {general_stats['overdue_tasks']}\n\n"
-            f"**Список пользователей:**\n"
-        )
+        # Из БД читается только показываемая часть списка, общее число есть в статистике
+        users = await asyncio.to_thread(db.list_users, _USERS_PREVIEW_SIZE)
+        general_stats = await asyncio.to_thread(db.get_general_stats)
+        total_users = general_stats['total_users']
+        
+        parts = [
+            f"{EMOJIS['admin']} <b>Управление пользователями</b>\n\n"
+            f"👥 <b>Всего пользователей:</b> {general_stats['total_users']}\n"
+            f"📋 <b>Всего задач:</b> {general_stats['total_tasks']}\n"
+            f"✅ <b>Выполнено:</b> {general_stats['completed_tasks']}\n"
+            f"🔴 <b>Просрочено:</b> {general_stats['overdue_tasks']}\n\n"
+            f"<b>Список пользователей:</b>"
+        ]
         
-        for user in users[:10]:
+        for user in users:
             role_emoji = EMOJIS['admin'] if user['role'] == 'admin' else EMOJIS['user']
-            text += f"• {role_emoji} {user['first_name']} {user['last_name']} ({USER_ROLES[user['role']]})\n"
+            user_name = html.escape(f"{user['first_name']} {user['last_name']}")
+            parts.append(f"• {role_emoji} {user_name} ({USER_ROLES[user['role']]})")
+        
+        if total_users > len(users):
+            parts.append(f"\n... и ещё {total_users - len(users)} пользователей")
         
-        if len(users) > 10:
-            text += f"\n... и ещё {len(users) - 10} пользователей"
+        text = "\n".join(parts)
         
         keyboard = [
             [InlineKeyboardButton(f"{EMOJIS['menu']} Главное меню", callback_data="main_menu")]
@@ -1125,17 +1497,18 @@ class TaskManagerBot:
         await query.edit_message_text(
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
     
     async def show_user_settings(self, query, db_user):
+        user_name = html.escape(f"{db_user['first_name']} {db_user['last_name']}")
         text = (
-            f"{EMOJIS['settings']} **Настройки пользователя**\n\n"
-            f"👤 **Имя:** {db_user['first_name']} {db_user['last_name']}\n"
-            f"🎭 **Роль:** {USER_ROLES[db_user['role']]}\n"
-            f"📅 **Дата регистрации:** {format_datetime(db_user['registered_at'], show_time=False)}\n\n"
-            f"🔔 **Уведомления:** Включены\n"
-            f"⏰ **Напоминания:** За 24ч, 6ч, 1ч до дедлайна"
+            f"{EMOJIS['settings']} <b>Настройки пользователя</b>\n\n"
+            f"👤 <b>Имя:</b> {user_name}\n"
+            f"🎭 <b>Роль:</b> {USER_ROLES[db_user['role']]}\n"
+            f"📅 <b>Дата регистрации:</b> {format_datetime(db_user['registered_at'], show_time=False)}\n\n"
+            f"🔔 <b>Уведомления:</b> Включены\n"
+            f"⏰ <b>Напоминания:</b> За 24ч, 6ч, 1ч до дедлайна"
         )
         
         keyboard = [
@@ -1147,14 +1520,14 @@ class TaskManagerBot:
         await query.edit_message_text(
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            parse_mode=ParseMode.HTML
         )
 
     async def start_edit_task(self, query, data, db_user):
         if db_user['role'] != 'admin':
             await query.answer("❌ Недостаточно прав")
             return
-        task_id = int(data.split('_')[-1])
+        task_id = int(data.rpartition('_')[2])
         context = query.message.chat  # not used, kept for symmetry
         keyboard = [
             [InlineKeyboardButton("Название", callback_data=f"edit_field_title_{task_id}")],
@@ -1169,7 +1542,7 @@ class TaskManagerBot:
         if db_user['role'] != 'admin':
             await query.answer("❌ Недостаточно прав")
             return
-        task_id = int(data.split('_')[-1])
+        task_id = int(data.rpartition('_')[2])
         keyboard = [
             [InlineKeyboardButton("Да, отменить", callback_data=f"confirm_cancel_yes_{task_id}")],
             [InlineKeyboardButton("Нет", callback_data=f"task_{task_id}")]
@@ -1177,21 +1550,22 @@ class TaskManagerBot:
         await query.edit_message_text("Вы уверены, что хотите отменить задачу?", reply_markup=InlineKeyboardMarkup(keyboard))
 
     async def confirm_cancel_task(self, query, data, db_user):
-        parts = data.split('_')
-        if parts[2] != 'yes':
+        answer, _, task_id_str = data.removeprefix("confirm_cancel_").partition("_")
+        if answer != 'yes':
             await query.answer("Отменено")
             return
-        task_id = int(parts[3])
-        if db.cancel_task(task_id, db_user['id']):
+        # Отмена и чтение обновлённой задачи - в одной транзакции
+        task = await asyncio.to_thread(db.cancel_task_and_fetch, int(task_id_str), db_user['id'])
+        if task:
             await query.answer("Задача отменена")
-            await self.show_task_detail(query, f"task_{task_id}", db_user)
+            await self._render_task_detail(query, task, db_user)
         else:
             await query.answer("Ошибка при отмене")
 
     async def start_create_task_conversation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        query = update.callback_query
+        query = _RenderDedupQuery(update.callback_query, context.user_data)
         user = update.effective_user
-        db_user = db.get_user_by_telegram_id(user.id)
+        db_user = await self._get_db_user(user.id)
         
         if not db_user or db_user['role'] != 'admin':
             await query.answer("❌ У вас нет прав для создания задач.")
@@ -1201,14 +1575,31 @@ class TaskManagerBot:
         return await self.start_create_task(query, context)
     
     async def cancel_create_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        query = update.callback_query
+        query = _RenderDedupQuery(update.callback_query, context.user_data)
         await query.answer()
         await query.edit_message_text("❌ Создание задачи отменено.")
         context.user_data.pop('creating_task', None)
         return ConversationHandler.END
     
-    def run(self):
-        application = Application.builder().token(config.TELEGRAM_TOKEN).build()
+    def build_application(self) -> Application:
+        """Создание приложения Telegram со всеми обработчиками"""
+        # Обновления обрабатываются параллельно, но не больше MAX_CONCURRENT_HANDLERS сразу
+        # и по очереди в пределах одного пользователя (диалоги ConversationHandler)
+        builder = (Application.builder()
+                   .token(config.TELEGRAM_TOKEN)
+                   .concurrent_updates(_PerUserUpdateProcessor(config.MAX_CONCURRENT_HANDLERS)))
+        if orjson:
+            builder = (builder
+                       .request(_OrjsonRequest(connection_pool_size=_CONNECTION_POOL_SIZE))
+                       .get_updates_request(_OrjsonRequest(connection_pool_size=1)))
+        else:
+            # Пул по умолчанию в PTB - одно соединение, параллельные отправки встали бы в очередь
+            builder = builder.connection_pool_size(_CONNECTION_POOL_SIZE)
+        application = builder.build()
+        
+        # Кнопки постоянной клавиатуры - навигация, а не ввод для шагов диалога
+        nav_buttons = filters.Text(list(self._nav_routes))
+        user_text = filters.TEXT & ~filters.COMMAND & ~nav_buttons
         
         registration_handler = ConversationHandler(
             entry_points=[CommandHandler("start", self.start_command)],
@@ -1221,16 +1612,19 @@ class TaskManagerBot:
         create_task_handler = ConversationHandler(
             entry_points=[CallbackQueryHandler(self.start_create_task_conversation, pattern="^create_task$")],
             states={
-                CREATING_TASK_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_task_title)],
-                CREATING_TASK_DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_task_description)],
+                CREATING_TASK_TITLE: [MessageHandler(user_text, self.handle_task_title)],
+                CREATING_TASK_DESCRIPTION: [MessageHandler(user_text, self.handle_task_description)],
                 CREATING_TASK_ASSIGNEE: [CallbackQueryHandler(self.handle_task_assignee)],
                 CREATING_TASK_DEADLINE: [
                     CallbackQueryHandler(self.handle_task_deadline),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_manual_deadline)
+                    MessageHandler(user_text, self.handle_manual_deadline)
                 ],
                 CREATING_TASK_PRIORITY: [CallbackQueryHandler(self.handle_task_priority)],
             },
-            fallbacks=[CallbackQueryHandler(self.cancel_create_task, pattern="^cancel_create_task$")]
+            fallbacks=[
+                CallbackQueryHandler(self.cancel_create_task, pattern="^cancel_create_task$"),
+                MessageHandler(nav_buttons, self.nav_button_during_create_task),
+            ]
         )
 
         application.add_handler(registration_handler)
@@ -1238,16 +1632,52 @@ class TaskManagerBot:
         application.add_handler(CommandHandler("help", self.help_command))
         application.add_handler(CommandHandler("menu", self.menu_command))
         application.add_handler(CommandHandler("my", self.my_command))
+        application.add_handler(MessageHandler(nav_buttons, self.handle_nav_button))
         application.add_handler(CallbackQueryHandler(self.button_callback))
         
         async def post_init(app):
-            loop = asyncio.get_event_loop()
-            loop.create_task(self.notification_manager.start_notification_loop(app))
+            self._background_tasks = [
+                asyncio.create_task(self.notification_manager.start_notification_loop(app)),
+                asyncio.create_task(self._activity_flush_loop()),
+            ]
+        
+        async def post_shutdown(app):
+            # Снимает слушателя БД, который будит цикл через уже закрывающийся event loop
+            self.notification_manager.stop()
+            for task in self._background_tasks:
+                task.cancel()
+            self._flush_user_activity()
+            self._report_executor.shutdown(wait=False, cancel_futures=True)
         
         application.post_init = post_init
+        application.post_shutdown = post_shutdown
+        return application
+    
+    def run(self):
+        """Запуск бота: через вебхук, если задан WEBHOOK_URL, иначе long polling"""
+        if config.WEBHOOK_URL:
+            self.run_webhook()
+            return
         
+        application = self.build_application()
         logger.info("🚀 Бот запущен!")
         application.run_polling(allowed_updates=Update.ALL_TYPES)
+    
+    def run_webhook(self):
+        """Запуск бота в режиме вебхука: Telegram сам присылает обновления"""
+        application = self.build_application()
+        # Секретный путь: токен бота, как рекомендует документация PTB
+        url_path = config.TELEGRAM_TOKEN
+        logger.info(f"🚀 Бот запущен (вебхук, порт {config.WEBHOOK_PORT})!")
+        application.run_webhook(
+            listen='0.0.0.0',
+            port=config.WEBHOOK_PORT,
+            url_path=url_path,
+            webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{url_path}",
+            secret_token=config.WEBHOOK_SECRET or None,
+            max_connections=40,
+            allowed_updates=Update.ALL_TYPES
+        )
 
 if __name__ == "__main__":
     bot = TaskManagerBot()
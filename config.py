@@ -4,7 +4,9 @@
 """
 
 import os
+import sys
 from pathlib import Path
+from types import MappingProxyType
 try:
     from dotenv import load_dotenv
     # Загружаем .env из корня проекта
@@ -15,7 +17,7 @@ except Exception:
     # Не критично, если python-dotenv не установлен
     pass
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, List, Mapping
 
 @dataclass
 class BotConfig:
@@ -26,6 +28,8 @@ class BotConfig:
     # Пароли для доступа
     ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD", "CHANGE_ME_ADMIN")
     USER_PASSWORD: str = os.getenv("USER_PASSWORD", "CHANGE_ME_USER")
+    # Соль для хеширования паролей (уникальная для каждой установки)
+    AUTH_SALT: str = os.getenv("AUTH_SALT", "CHANGE_ME_SALT")
     
     # База данных
     DATABASE_PATH: str = "task_manager.db"
@@ -39,20 +43,35 @@ class BotConfig:
     
     # Настройки диаграмм
     CHARTS_FOLDER: str = "charts"
+    # Разрешение PNG-диаграмм (для просмотра в Telegram 150 dpi достаточно)
+    CHART_DPI: int = int(os.getenv("CHART_DPI", "150"))
     
     # Лимиты
     MAX_TASK_TITLE_LENGTH: int = 100
     MAX_TASK_DESCRIPTION_LENGTH: int = 500
     MAX_TASKS_PER_PAGE: int = 5
+    # Сколько обновлений Telegram обрабатывается одновременно
+    MAX_CONCURRENT_HANDLERS: int = int(os.getenv("MAX_CONCURRENT_HANDLERS", "32"))
+    # Сколько отчётов (Excel, Гант) может строиться одновременно
+    MAX_CONCURRENT_REPORTS: int = int(os.getenv("MAX_CONCURRENT_REPORTS", "2"))
 
     # Часовой пояс отображения (сдвиг в часах относительно UTC)
     DISPLAY_TZ_OFFSET_HOURS: int = int(os.getenv("TZ_OFFSET_HOURS", "5"))
 
+    # Вебхук (если WEBHOOK_URL не задан, бот работает через long polling)
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+
 # Глобальная конфигурация
 config = BotConfig()
 
+def _frozen(mapping: Dict[str, str]) -> Mapping[str, str]:
+    """Неизменяемый справочник с интернированными ключами"""
+    return MappingProxyType({sys.intern(key): value for key, value in mapping.items()})
+
 # Эмодзи для красивого интерфейса
-EMOJIS = {
+EMOJIS = _frozen({
     'menu': '📋',
     'create_task': '➕',
     'my_tasks': '📝',
@@ -79,26 +98,26 @@ EMOJIS = {
     'success': '✅',
     'error': '❌',
     'info': 'ℹ️'
-}
+})
 
 # Статусы задач
-TASK_STATUS = {
+TASK_STATUS = _frozen({
     'new': 'Новая',
     'in_progress': 'В работе',
     'completed': 'Выполнена',
     'overdue': 'Просрочена',
     'cancelled': 'Отменена'
-}
+})
 
 # Приоритеты задач
-TASK_PRIORITY = {
+TASK_PRIORITY = _frozen({
     'low': 'Низкий',
     'medium': 'Средний',
     'high': 'Высокий'
-}
+})
 
 # Роли пользователей
-USER_ROLES = {
+USER_ROLES = _frozen({
     'admin': 'Администратор',
     'user': 'Исполнитель'
-}
+})
@@ -5,105 +5,301 @@
 
 import sqlite3
 import logging
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from contextlib import contextmanager
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Сколько ждать (сек), пока другое соединение держит блокировку записи
+_BUSY_TIMEOUT = 5.0
+# Кэш страниц на соединение (отрицательное значение - в КиБ) и окно mmap (байты)
+_CACHE_SIZE_KIB = 65536
+_MMAP_SIZE = 256 * 1024 * 1024
+# Сколько подготовленных выражений sqlite3 держит на соединение (по умолчанию 128):
+# с запасом на варианты динамических запросов поиска и пагинации
+_STATEMENT_CACHE_SIZE = 512
+# Колонки задачи, нужные для кнопок списка (без описания и JOIN с пользователями)
+_TASK_LIST_COLUMNS = 'id, title, status, priority, assignee_id'
+# Версия схемы в PRAGMA user_version: увеличивать при каждом изменении DDL
+_SCHEMA_VERSION = 3
+# Сколько строк читать за раз при потоковой выборке
+_FETCH_BATCH = 128
+# Сколько строк каждого индекса просматривает ANALYZE при запуске
+_ANALYSIS_LIMIT = 1000
+# Триграммный индекс FTS5 находит подстроки не короче трёх символов
+_FTS_MIN_QUERY = 3
+# Выборка обхода уведомлений: один неизменный текст запроса, чтобы sqlite3
+# каждый раз брал готовое выражение из кэша, и только нужные обходу колонки
+_PENDING_NOTIFICATIONS_SQL = '''
+    SELECT n.id, n.task_id, u.telegram_id, n.message
+    FROM notifications n
+    JOIN users u ON n.user_id = u.id
+    JOIN tasks t ON n.task_id = t.id
+    WHERE n.is_sent = 0 AND n.scheduled_at <= datetime('now')
+    ORDER BY n.scheduled_at
+'''
+
 class DatabaseManager:
     """Менеджер базы данных для управления задачами"""
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or config.DATABASE_PATH
+        # У каждого потока своё соединение: открывается один раз и переиспользуется
+        self._local = threading.local()
+        # Все открытые соединения, чтобы закрыть их при остановке
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # Подписчики на новые уведомления (аналог LISTEN/NOTIFY внутри процесса)
+        self._notification_listeners: List[Callable[[], None]] = []
         self.init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения с настройками для параллельной работы"""
+        # Соединение используется только своим потоком; проверка отключена,
+        # чтобы close() мог закрыть его из основного потока
+        conn = sqlite3.connect(self.db_path, timeout=_BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=_STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        # В режиме WAL synchronous=NORMAL безопасен и избавляет от fsync на каждый COMMIT
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute(f'PRAGMA cache_size = -{_CACHE_SIZE_KIB}')
+        # Чтение через отображение файла в память вместо read() на каждую страницу
+        conn.execute(f'PRAGMA mmap_size = {_MMAP_SIZE}')
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def close(self):
+        """Закрытие всех соединений (при остановке бота)"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка при закрытии соединения с БД: {e}")
+        self._local = threading.local()
+    
+    def add_notification_listener(self, callback: Callable[[], None]):
+        """
+        Подписка на создание уведомлений: callback вызывается после фиксации
+        вставки, в том потоке, который её выполнил
+        """
+        self._notification_listeners.append(callback)
+    
+    def remove_notification_listener(self, callback: Callable[[], None]):
+        """Отмена подписки на создание уведомлений"""
+        if callback in self._notification_listeners:
+            self._notification_listeners.remove(callback)
+    
+    def _notify_listeners(self):
+        """Оповещение подписчиков о новых уведомлениях"""
+        for callback in self._notification_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка в подписчике на уведомления: {e}")
+    
     @contextmanager
     def get_connection(self):
         """Контекстный менеджер для подключения к БД"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
         try:
             yield conn
         finally:
-            conn.close()
+            # Незафиксированные изменения откатываются, как раньше при закрытии соединения
+            if conn.in_transaction:
+                conn.rollback()
     
     def init_database(self):
         """Инициализация базы данных и создание таблиц"""
         with self.get_connection() as conn:
+            # WAL: читатели не блокируют писателя и наоборот (режим сохраняется в файле БД)
+            conn.execute('PRAGMA journal_mode = WAL')
             cursor = conn.cursor()
             
-            # Таблица пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    role TEXT NOT NULL CHECK (role IN ('admin', 'user')),
-                    is_active BOOLEAN DEFAULT 1,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()[0] < _SCHEMA_VERSION:
+                self._create_schema(cursor)
+                cursor.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
             
-            # Таблица задач
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    creator_id INTEGER NOT NULL,
-                    assignee_id INTEGER,
-                    status TEXT NOT NULL DEFAULT 'new' 
-                        CHECK (status IN ('new', 'in_progress', 'completed', 'overdue', 'cancelled')),
-                    priority TEXT NOT NULL DEFAULT 'medium' 
-                        CHECK (priority IN ('low', 'medium', 'high')),
-                    deadline TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    FOREIGN KEY (creator_id) REFERENCES users (id),
-                    FOREIGN KEY (assignee_id) REFERENCES users (id)
-                )
-            ''')
+            # Статистика для планировщика (выбор индекса под фильтры поиска);
+            # analysis_limit ограничивает число просматриваемых строк индекса
+            cursor.execute(f'PRAGMA analysis_limit = {_ANALYSIS_LIMIT}')
+            cursor.execute('ANALYZE')
             
-            # Таблица уведомлений
+            conn.commit()
+            logger.info("База данных инициализирована успешно")
+    
+    @classmethod
+    def _create_schema(cls, cursor):
+        """
+        Создание таблиц, индексов и полнотекстового поиска
+        
+        Выполняется, только если версия схемы в файле БД (PRAGMA user_version)
+        меньше _SCHEMA_VERSION. Все выражения идемпотентны, поэтому то же место
+        годится и для миграций старых файлов.
+        """
+        # Таблица пользователей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER UNIQUE NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                role TEXT NOT NULL CHECK (role IN ('admin', 'user')),
+                is_active BOOLEAN DEFAULT 1,
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                full_name TEXT GENERATED ALWAYS AS (
+                    COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')
+                ) VIRTUAL
+            )
+        ''')
+        # Версия 2: полное имя - генерируемая колонка (в старых файлах её нет)
+        cursor.execute('PRAGMA table_xinfo(users)')
+        if 'full_name' not in {row[1] for row in cursor.fetchall()}:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS notifications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    task_id INTEGER NOT NULL,
-                    type TEXT NOT NULL CHECK (type IN ('reminder', 'assignment', 'deadline', 'completed')),
-                    message TEXT NOT NULL,
-                    is_sent BOOLEAN DEFAULT 0,
-                    scheduled_at TIMESTAMP NOT NULL,
-                    sent_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    FOREIGN KEY (task_id) REFERENCES tasks (id)
-                )
+                ALTER TABLE users ADD COLUMN full_name TEXT GENERATED ALWAYS AS (
+                    COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')
+                ) VIRTUAL
             ''')
-            
-            # Таблица истории изменений задач
+        
+        # Таблица задач
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                description TEXT,
+                creator_id INTEGER NOT NULL,
+                assignee_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'new' 
+                    CHECK (status IN ('new', 'in_progress', 'completed', 'overdue', 'cancelled')),
+                priority TEXT NOT NULL DEFAULT 'medium' 
+                    CHECK (priority IN ('low', 'medium', 'high')),
+                deadline TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                FOREIGN KEY (creator_id) REFERENCES users (id),
+                FOREIGN KEY (assignee_id) REFERENCES users (id)
+            )
+        ''')
+        
+        # Таблица уведомлений
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                task_id INTEGER NOT NULL,
+                type TEXT NOT NULL CHECK (type IN ('reminder', 'assignment', 'deadline', 'completed')),
+                message TEXT NOT NULL,
+                is_sent BOOLEAN DEFAULT 0,
+                scheduled_at TIMESTAMP NOT NULL,
+                sent_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                hours_before INTEGER,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (task_id) REFERENCES tasks (id)
+            )
+        ''')
+        # Версия 3: за сколько часов до дедлайна напоминание (для типа 'reminder');
+        # в старых файлах значение восстанавливается из текста напоминания - и в
+        # HTML-разметке ("осталось <b>N часов</b>"), и в прежней Markdown ("осталось **N часов**")
+        cursor.execute('PRAGMA table_info(notifications)')
+        if 'hours_before' not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute('ALTER TABLE notifications ADD COLUMN hours_before INTEGER')
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS task_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    task_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    action TEXT NOT NULL,
-                    old_value TEXT,
-                    new_value TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (task_id) REFERENCES tasks (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
+                UPDATE notifications
+                SET hours_before = CAST(CASE
+                    WHEN instr(message, 'осталось <b>') > 0
+                        THEN substr(message, instr(message, 'осталось <b>') + 12)
+                    ELSE substr(message, instr(message, 'осталось **') + 11)
+                END AS INTEGER)
+                WHERE type = 'reminder'
+                  AND (instr(message, 'осталось <b>') > 0 OR instr(message, 'осталось **') > 0)
             ''')
-            
-            conn.commit()
-            logger.info("База данных инициализирована успешно")
+        
+        # Таблица истории изменений задач
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS task_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                old_value TEXT,
+                new_value TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (task_id) REFERENCES tasks (id),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        # Индексы под частые выборки (users.telegram_id уже индексирован через UNIQUE)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_assignee_status ON tasks (assignee_id, status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks (deadline)')
+        # Частичный индекс: в нём только неотправленные уведомления
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notifications_pending
+            ON notifications (scheduled_at) WHERE is_sent = 0
+        ''')
+        # (task_id, type) - префикс индекса, отдельный индекс по нему не нужен
+        cursor.execute('DROP INDEX IF EXISTS idx_notifications_task_type')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notifications_task_type_hours
+            ON notifications (task_id, type, hours_before)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_history_task ON task_history (task_id, created_at)')
+        
+        cls._init_task_search(cursor)
+    
+    @staticmethod
+    def _init_task_search(cursor):
+        """
+        Полнотекстовый индекс по названию и описанию задач
+        
+        Таблица tasks_fts хранит только индекс (content='tasks'), а триггеры
+        держат его в согласии с tasks. При первом создании индекс
+        заполняется из уже существующих задач.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'")
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                title, description, content='tasks', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO tasks_fts (rowid, title, description)
+                VALUES (new.id, new.title, new.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+                INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+                INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+                INSERT INTO tasks_fts (rowid, title, description)
+                VALUES (new.id, new.title, new.description);
+            END
+        ''')
+        
+        if not exists:
+            cursor.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
     
     # ПОЛЬЗОВАТЕЛИ
     def create_user(self, telegram_id: int, username: str, first_name: str, 
@@ -149,6 +345,22 @@ class DatabaseManager:
             ''', (telegram_id,))
             conn.commit()
     
+    def bulk_update_activity(self, activity: Dict[int, datetime]):
+        """
+        Пакетное обновление времени последней активности одной транзакцией
+        
+        Args:
+            activity: telegram_id -> время последней активности (UTC)
+        """
+        if not activity:
+            return
+        with self.get_connection() as conn:
+            conn.executemany(
+                'UPDATE users SET last_activity = ? WHERE telegram_id = ?',
+                [(seen_at, telegram_id) for telegram_id, seen_at in activity.items()]
+            )
+            conn.commit()
+    
     def get_all_users(self) -> List[Dict]:
         """Получение всех пользователей"""
         with self.get_connection() as conn:
@@ -156,6 +368,16 @@ class DatabaseManager:
             cursor.execute('SELECT * FROM users WHERE is_active = 1 ORDER BY first_name')
             return [dict(row) for row in cursor.fetchall()]
     
+    def list_users(self, limit: int, offset: int = 0) -> List[Dict]:
+        """Страница активных пользователей в том же порядке, что и get_all_users"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM users WHERE is_active = 1
+                ORDER BY first_name, id LIMIT ? OFFSET ?
+            ''', (limit, offset))
+            return [dict(row) for row in cursor.fetchall()]
+    
     def get_users_by_role(self, role: str) -> List[Dict]:
         """Получение пользователей по роли"""
         with self.get_connection() as conn:
@@ -168,8 +390,22 @@ class DatabaseManager:
                    assignee_id: int = None, priority: str = 'medium', 
                    deadline: datetime = None) -> int:
         """Создание новой задачи"""
+        return self.create_task_with_history(title, description, creator_id,
+                                             assignee_id, priority, deadline)['id']
+    
+    def create_task_with_history(self, title: str, description: str, creator_id: int,
+                                 assignee_id: int = None, priority: str = 'medium',
+                                 deadline: datetime = None) -> Dict:
+        """
+        Создание задачи, запись в историю и чтение результата в одной транзакции
+        
+        Returns:
+            Созданная задача (как get_task_by_id)
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            # Блокировку записи берём сразу, чтобы не упереться в SQLITE_BUSY посреди транзакции
+            cursor.execute('BEGIN IMMEDIATE')
             cursor.execute('''
                 INSERT INTO tasks (title, description, creator_id, assignee_id, priority, deadline)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -179,35 +415,41 @@ class DatabaseManager:
             # Добавляем запись в историю
             self._add_task_history(cursor, task_id, creator_id, 'created', None, 'Задача создана')
             
+            task = self._fetch_task(cursor, task_id)
             conn.commit()
             logger.info(f"Задача '{title}' создана с ID {task_id}")
-            return task_id
+            return task
     
     def get_task_by_id(self, task_id: int) -> Optional[Dict]:
         """Получение задачи по ID"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT t.*, 
-                       c.first_name || ' ' || c.last_name as creator_name,
-                       a.first_name || ' ' || a.last_name as assignee_name,
-                       a.telegram_id as assignee_telegram_id
-                FROM tasks t
-                LEFT JOIN users c ON t.creator_id = c.id
-                LEFT JOIN users a ON t.assignee_id = a.id
-                WHERE t.id = ?
-            ''', (task_id,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+            return self._fetch_task(conn.cursor(), task_id)
+    
+    def _fetch_task(self, cursor, task_id: int) -> Optional[Dict]:
+        """Задача с именами создателя и исполнителя (в рамках открытого соединения)"""
+        cursor.execute('''
+            SELECT t.*, 
+                   c.full_name as creator_name,
+                   a.full_name as assignee_name,
+                   a.telegram_id as assignee_telegram_id,
+                   c.telegram_id as creator_telegram_id
+            FROM tasks t
+            LEFT JOIN users c ON t.creator_id = c.id
+            LEFT JOIN users a ON t.assignee_id = a.id
+            WHERE t.id = ?
+        ''', (task_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
     
-    def get_tasks_by_user(self, user_id: int, status: str = None) -> List[Dict]:
-        """Получение задач пользователя"""
+    def get_tasks_by_user(self, user_id: int, status: Union[str, Sequence[str]] = None,
+                          limit: int = None, offset: int = 0) -> List[Dict]:
+        """Получение задач пользователя (status - один статус или набор статусов)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             query = '''
                 SELECT t.*, 
-                       c.first_name || ' ' || c.last_name as creator_name,
-                       a.first_name || ' ' || a.last_name as assignee_name
+                       c.full_name as creator_name,
+                       a.full_name as assignee_name
                 FROM tasks t
                 LEFT JOIN users c ON t.creator_id = c.id
                 LEFT JOIN users a ON t.assignee_id = a.id
@@ -215,23 +457,73 @@ class DatabaseManager:
             '''
             params = [user_id]
             
-            if status:
+            if isinstance(status, str):
                 query += ' AND t.status = ?'
                 params.append(status)
+            elif status:
+                query += f" AND t.status IN ({', '.join('?' * len(status))})"
+                params.extend(status)
             
             query += ' ORDER BY t.deadline ASC, t.created_at DESC'
             
+            if limit:
+                query += ' LIMIT ? OFFSET ?'
+                params.extend([limit, offset])
+            
             cursor.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def _task_filter(assignee_id: Optional[int], status: Union[str, Sequence[str], None]) -> Tuple[str, List]:
+        """Условие WHERE по исполнителю и статусу (одному или набору) и его параметры"""
+        query = ' WHERE 1=1'
+        params = []
+        
+        if assignee_id is not None:
+            query += ' AND assignee_id = ?'
+            params.append(assignee_id)
+        
+        if isinstance(status, str):
+            query += ' AND status = ?'
+            params.append(status)
+        elif status:
+            query += f" AND status IN ({', '.join('?' * len(status))})"
+            params.extend(status)
+        
+        return query, params
+    
+    def count_tasks(self, assignee_id: int = None, status: Union[str, Sequence[str]] = None) -> int:
+        """Количество задач (всех или исполнителя) для постраничного вывода"""
+        where, params = self._task_filter(assignee_id, status)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT COUNT(*) FROM tasks{where}', params)
+            return cursor.fetchone()[0]
+    
+    def get_task_list_page(self, limit: int, offset: int = 0, assignee_id: int = None,
+                           status: Union[str, Sequence[str]] = None) -> List[Dict]:
+        """
+        Страница списка задач только с полями для кнопок списка
+        
+        Порядок тот же, что у get_all_tasks и get_tasks_by_user.
+        """
+        where, params = self._task_filter(assignee_id, status)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {_TASK_LIST_COLUMNS} FROM tasks{where}
+                ORDER BY deadline ASC, created_at DESC LIMIT ? OFFSET ?
+            ''', params + [limit, offset])
+            return [dict(row) for row in cursor.fetchall()]
+    
     def get_all_tasks(self, status: str = None, limit: int = None, offset: int = 0) -> List[Dict]:
         """Получение всех задач с пагинацией"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             query = '''
                 SELECT t.*, 
-                       c.first_name || ' ' || c.last_name as creator_name,
-                       a.first_name || ' ' || a.last_name as assignee_name
+                       c.full_name as creator_name,
+                       a.full_name as assignee_name
                 FROM tasks t
                 LEFT JOIN users c ON t.creator_id = c.id
                 LEFT JOIN users a ON t.assignee_id = a.id
@@ -260,6 +552,8 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # Чтение и запись под одной блокировкой: старые значения не устареют до UPDATE
+                cursor.execute('BEGIN IMMEDIATE')
                 # Получим текущую задачу
                 cursor.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
                 row = cursor.fetchone()
@@ -277,10 +571,17 @@ class DatabaseManager:
                 params.append(task_id)
                 sql = f"UPDATE tasks SET {' , '.join(set_parts)} WHERE id = ?"
                 cursor.execute(sql, params)
-                # История по каждому измененному полю
-                for field, value in changes.items():
-                    old_value = current.get(field)
-                    self._add_task_history(cursor, task_id, user_id, f"{field}_updated", str(old_value) if old_value is not None else None, str(value) if value is not None else None)
+                # История по каждому измененному полю: одно подготовленное выражение на все строки
+                history_rows = [
+                    (task_id, user_id, f"{field}_updated",
+                     str(current[field]) if current[field] is not None else None,
+                     str(value) if value is not None else None)
+                    for field, value in changes.items()
+                ]
+                cursor.executemany('''
+                    INSERT INTO task_history (task_id, user_id, action, old_value, new_value)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', history_rows)
                 conn.commit()
                 return True
         except Exception as e:
@@ -293,30 +594,40 @@ class DatabaseManager:
             cursor = conn.cursor()
             base = '''
                 SELECT t.*, 
-                       c.first_name || ' ' || c.last_name as creator_name,
-                       a.first_name || ' ' || a.last_name as assignee_name
+                       c.full_name as creator_name,
+                       a.full_name as assignee_name
                 FROM tasks t
                 LEFT JOIN users c ON t.creator_id = c.id
                 LEFT JOIN users a ON t.assignee_id = a.id
                 WHERE 1=1
             '''
             params: List = []
-            if query_text:
-                base += " AND (t.title LIKE ? OR t.description LIKE ? OR c.first_name || ' ' || c.last_name LIKE ? OR a.first_name || ' ' || a.last_name LIKE ?)"
-                like = f"%{query_text}%"
-                params.extend([like, like, like, like])
-            if status:
-                base += " AND t.status = ?"
-                params.append(status)
-            if priority:
-                base += " AND t.priority = ?"
-                params.append(priority)
+            # Сначала равенства (их планировщик берёт из индексов), текстовое условие - последним
             if assignee_id:
                 base += " AND t.assignee_id = ?"
                 params.append(assignee_id)
             if creator_id:
                 base += " AND t.creator_id = ?"
                 params.append(creator_id)
+            if status:
+                base += " AND t.status = ?"
+                params.append(status)
+            if priority:
+                base += " AND t.priority = ?"
+                params.append(priority)
+            if query_text:
+                like = f"%{query_text}%"
+                if len(query_text) >= _FTS_MIN_QUERY:
+                    # Текст задачи ищем по индексу: запрос - одна фраза в кавычках
+                    base += " AND (t.id IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)"
+                    params.append('"' + query_text.replace('"', '""') + '"')
+                else:
+                    base += " AND (t.title LIKE ? OR t.description LIKE ?"
+                    params.extend([like, like])
+                # Пользователей немного: имена проверяем по users, а не по каждой задаче
+                base += (" OR t.creator_id IN (SELECT id FROM users WHERE full_name LIKE ?)"
+                         " OR t.assignee_id IN (SELECT id FROM users WHERE full_name LIKE ?))")
+                params.extend([like, like])
             base += " ORDER BY t.deadline ASC, t.created_at DESC LIMIT ? OFFSET ?"
             params.extend([limit, offset])
             cursor.execute(base, params)
@@ -324,62 +635,95 @@ class DatabaseManager:
 
     def cancel_task(self, task_id: int, user_id: int) -> bool:
         """Отменить задачу (status = cancelled)"""
+        return self.cancel_task_and_fetch(task_id, user_id) is not None
+    
+    def cancel_task_and_fetch(self, task_id: int, user_id: int) -> Optional[Dict]:
+        """
+        Отмена задачи с записью в историю и чтением результата в одной транзакции
+        
+        В отличие от update_task_status_and_fetch, completed_at не трогается:
+        у отменённой выполненной задачи сохраняется время выполнения.
+        
+        Returns:
+            Задача после отмены (как get_task_by_id) с дополнительным
+            полем old_status или None при ошибке
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
                 cursor.execute('SELECT status FROM tasks WHERE id = ?', (task_id,))
                 row = cursor.fetchone()
                 if not row:
                     logger.warning(f"Задача {task_id} не найдена для отмены")
-                    return False
+                    return None
                 old_status = row[0]
                 cursor.execute('''
                     UPDATE tasks SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
                     WHERE id = ?
                 ''', (task_id,))
                 self._add_task_history(cursor, task_id, user_id, 'status_changed', old_status, 'cancelled')
+                
+                task = self._fetch_task(cursor, task_id)
                 conn.commit()
-                return True
+                task['old_status'] = old_status
+                return task
         except Exception as e:
             logger.error(f"Ошибка при отмене задачи: {e}")
-            return False
+            return None
     
     def update_task_status(self, task_id: int, status: str, user_id: int) -> bool:
         """Обновление статуса задачи"""
+        return self.update_task_status_and_fetch(task_id, status, user_id) is not None
+    
+    def update_task_status_and_fetch(self, task_id: int, status: str, user_id: int) -> Optional[Dict]:
+        """
+        Обновление статуса задачи с записью в историю и чтением результата
+        в одной транзакции
+        
+        Returns:
+            Задача после изменения (как get_task_by_id) с дополнительным
+            полем old_status или None при ошибке
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # Старый статус читается уже под блокировкой записи
+                cursor.execute('BEGIN IMMEDIATE')
                 
                 # Получаем старый статус
                 cursor.execute('SELECT status FROM tasks WHERE id = ?', (task_id,))
                 row = cursor.fetchone()
                 if not row:
                     logger.warning(f"Задача {task_id} не найдена для обновления статуса")
-                    return False
+                    return None
                 old_status = row[0]
                 
-                # Обновляем статус
-                completed_at = datetime.utcnow() if status == 'completed' else None
+                # Обновляем статус (время выполнения ставит сама SQLite)
                 cursor.execute('''
-                    UPDATE tasks SET status = ?, updated_at = CURRENT_TIMESTAMP, completed_at = ?
+                    UPDATE tasks SET status = ?, updated_at = CURRENT_TIMESTAMP,
+                        completed_at = CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP END
                     WHERE id = ?
-                ''', (status, completed_at, task_id))
+                ''', (status, status, task_id))
                 
                 # Добавляем в историю
                 self._add_task_history(cursor, task_id, user_id, 'status_changed', old_status, status)
                 
+                task = self._fetch_task(cursor, task_id)
                 conn.commit()
+                task['old_status'] = old_status
                 logger.info(f"Статус задачи {task_id} изменен на {status}")
-                return True
+                return task
         except Exception as e:
             logger.error(f"Ошибка при обновлении статуса задачи: {e}")
-            return False
+            return None
     
     def assign_task(self, task_id: int, assignee_id: int, user_id: int) -> bool:
         """Назначение задачи исполнителю"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
                 
                 # Получаем текущего исполнителя
                 cursor.execute('SELECT assignee_id FROM tasks WHERE id = ?', (task_id,))
@@ -406,14 +750,68 @@ class DatabaseManager:
             logger.error(f"Ошибка при назначении задачи: {e}")
             return False
     
+    def get_tasks_needing_reminder(self, now: datetime, hours_before: Sequence[int]) -> List[Dict]:
+        """
+        Открытые назначенные задачи, для которых в ближайший час наступает
+        время хотя бы одного напоминания (дедлайн в (now + h, now + h + 1ч])
+        
+        Каждое окно - отдельный диапазон по idx_tasks_deadline.
+        """
+        if not hours_before:
+            return []
+        windows = []
+        params: List = []
+        for hours in hours_before:
+            windows.append('(t.deadline > ? AND t.deadline <= ?)')
+            params.extend([now + timedelta(hours=hours), now + timedelta(hours=hours + 1)])
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT t.*, 
+                       c.full_name as creator_name,
+                       a.full_name as assignee_name,
+                       a.telegram_id as assignee_telegram_id
+                FROM tasks t
+                JOIN users a ON t.assignee_id = a.id
+                LEFT JOIN users c ON t.creator_id = c.id
+                WHERE t.status IN ('new', 'in_progress')
+                AND ({' OR '.join(windows)})
+            ''', params)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_overdue_tasks_without_notification(self) -> List[Dict]:
+        """
+        Назначенные просроченные задачи, по которым ещё нет уведомления типа 'deadline'
+        
+        Исполнитель подтягивается внутренним JOIN: задачи без исполнителя
+        отсекаются в запросе, а строки уже содержат всё нужное для уведомления.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT t.*, 
+                       c.full_name as creator_name,
+                       a.full_name as assignee_name,
+                       a.telegram_id as assignee_telegram_id
+                FROM tasks t
+                JOIN users a ON t.assignee_id = a.id
+                LEFT JOIN users c ON t.creator_id = c.id
+                WHERE t.deadline < datetime('now') 
+                AND t.status NOT IN ('completed', 'cancelled')
+                AND NOT EXISTS (
+                    SELECT 1 FROM notifications n WHERE n.task_id = t.id AND n.type = 'deadline'
+                )
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+    
     def get_overdue_tasks(self) -> List[Dict]:
         """Получение просроченных задач"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT t.*, 
-                       c.first_name || ' ' || c.last_name as creator_name,
-                       a.first_name || ' ' || a.last_name as assignee_name,
+                       c.full_name as creator_name,
+                       a.full_name as assignee_name,
                        a.telegram_id as assignee_telegram_id
                 FROM tasks t
                 LEFT JOIN users c ON t.creator_id = c.id
@@ -439,17 +837,79 @@ class DatabaseManager:
     
     # УВЕДОМЛЕНИЯ
     def create_notification(self, user_id: int, task_id: int, notification_type: str, 
-                          message: str, scheduled_at: datetime) -> int:
-        """Создание уведомления"""
+                          message: str, scheduled_at: datetime,
+                          hours_before: Optional[int] = None) -> int:
+        """Создание уведомления (hours_before - только для напоминаний о дедлайне)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO notifications (user_id, task_id, type, message, scheduled_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, task_id, notification_type, message, scheduled_at))
+                INSERT INTO notifications (user_id, task_id, type, message, scheduled_at, hours_before)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, task_id, notification_type, message, scheduled_at, hours_before))
             notification_id = cursor.lastrowid
             conn.commit()
-            return notification_id
+        self._notify_listeners()
+        return notification_id
+    
+    def create_notifications_if_absent(self, notification_type: str,
+                                       notifications: Sequence[Tuple[int, int, str]]) -> int:
+        """
+        Создание уведомлений к отправке сейчас одной транзакцией, пропуская
+        задачи, по которым уведомление этого типа уже есть
+        
+        Args:
+            notification_type: Тип уведомлений
+            notifications: Кортежи (user_id, task_id, message)
+            
+        Returns:
+            Сколько уведомлений создано
+        """
+        if not notifications:
+            return 0
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # scheduled_at - по часам SQLite, как и в выборке обхода
+            cursor.executemany('''
+                INSERT INTO notifications (user_id, task_id, type, message, scheduled_at)
+                SELECT ?, ?, ?, ?, CURRENT_TIMESTAMP
+                WHERE NOT EXISTS (SELECT 1 FROM notifications WHERE task_id = ? AND type = ?)
+            ''', [(user_id, task_id, notification_type, message, task_id, notification_type)
+                  for user_id, task_id, message in notifications])
+            conn.commit()
+            created = cursor.rowcount
+        if created:
+            self._notify_listeners()
+        return created
+    
+    def create_reminders_if_absent(self, reminders: Sequence[Tuple[int, int, int, str, datetime]]) -> int:
+        """
+        Создание напоминаний о дедлайне одной транзакцией, пропуская те, для
+        которых уже есть неотправленное напоминание с тем же hours_before
+        
+        Args:
+            reminders: Кортежи (user_id, task_id, hours_before, message, scheduled_at)
+            
+        Returns:
+            Сколько напоминаний создано
+        """
+        if not reminders:
+            return 0
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO notifications (user_id, task_id, type, message, scheduled_at, hours_before)
+                SELECT ?, ?, 'reminder', ?, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM notifications
+                    WHERE task_id = ? AND type = 'reminder' AND hours_before = ? AND is_sent = 0
+                )
+            ''', [(user_id, task_id, message, scheduled_at, hours_before, task_id, hours_before)
+                  for user_id, task_id, hours_before, message, scheduled_at in reminders])
+            conn.commit()
+            created = cursor.rowcount
+        if created:
+            self._notify_listeners()
+        return created
     
     def get_pending_notifications(self) -> List[Dict]:
         """Получение неотправленных уведомлений"""
@@ -464,6 +924,39 @@ class DatabaseManager:
                 ORDER BY n.scheduled_at
             ''')
             return [dict(row) for row in cursor.fetchall()]
+    
+    def get_seconds_until_next_notification(self) -> Optional[float]:
+        """
+        Сколько секунд до ближайшего ещё не наступившего неотправленного
+        уведомления (по тем же часам SQLite, что и выборка обхода); None -
+        если ждать нечего
+        
+        Просроченные неотправленные (ошибка доставки) не учитываются: их
+        повтор идёт с обычным интервалом, а не в непрерывном цикле.
+        
+        Задержка считается от datetime('now'), усечённого до секунды, как и в
+        выборке обхода: scheduled_at хранится с микросекундами, и по точному
+        julianday('now') в последнюю секунду перед сроком пауза была бы нулевой,
+        а обход ещё ничего не находил бы.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT (julianday(MIN(scheduled_at)) - julianday(datetime('now'))) * 86400
+                FROM notifications WHERE is_sent = 0 AND scheduled_at > datetime('now')
+            ''')
+            return cursor.fetchone()[0]
+    
+    def get_pending_notification_rows(self) -> List[Tuple[int, int, int, str]]:
+        """
+        Неотправленные уведомления для обхода: кортежи
+        (id, task_id, telegram_id, message) без построения Row и dict
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(_PENDING_NOTIFICATIONS_SQL)
+            return cursor.fetchall()
 
     def get_unsent_notifications_by_task_type(self, task_id: int, notif_type: str) -> List[Dict]:
         """Получение несент уведомлений по задаче и типу (включая будущие)"""
@@ -480,9 +973,21 @@ class DatabaseManager:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT 1 FROM notifications WHERE task_id = ? AND type = ? LIMIT 1
+                SELECT EXISTS (SELECT 1 FROM notifications WHERE task_id = ? AND type = ?)
             ''', (task_id, notif_type))
-            return cursor.fetchone() is not None
+            return bool(cursor.fetchone()[0])
+    
+    def reminder_exists(self, task_id: int, hours_before: int) -> bool:
+        """Есть ли неотправленное напоминание по задаче за hours_before часов до дедлайна"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT EXISTS (
+                    SELECT 1 FROM notifications
+                    WHERE task_id = ? AND type = 'reminder' AND hours_before = ? AND is_sent = 0
+                )
+            ''', (task_id, hours_before))
+            return bool(cursor.fetchone()[0])
     
     def mark_notification_sent(self, notification_id: int):
         """Отметка уведомления как отправленного"""
@@ -494,6 +999,17 @@ class DatabaseManager:
             ''', (notification_id,))
             conn.commit()
     
+    def mark_notifications_sent(self, notification_ids: Sequence[int]):
+        """Отметка нескольких уведомлений как отправленных одной транзакцией"""
+        if not notification_ids:
+            return
+        with self.get_connection() as conn:
+            conn.executemany('''
+                UPDATE notifications SET is_sent = 1, sent_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(notification_id,) for notification_id in notification_ids])
+            conn.commit()
+    
     # ИСТОРИЯ
     def _add_task_history(self, cursor, task_id: int, user_id: int, action: str, 
                          old_value: str = None, new_value: str = None):
@@ -505,16 +1021,34 @@ class DatabaseManager:
     
     def get_task_history(self, task_id: int) -> List[Dict]:
         """Получение истории изменений задачи"""
+        return list(self.iter_task_history(task_id))
+    
+    def iter_task_history(self, task_id: int) -> Iterator[Dict]:
+        """
+        История изменений задачи (новые записи первыми) по мере чтения
+        
+        Строки читаются пачками, поэтому вызывающий код может остановиться
+        на первых записях, не загружая всю историю. Генератор нужно
+        дочитать (или закрыть) в том же потоке, где он начат.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT th.*, u.first_name || ' ' || u.last_name as user_name
-                FROM task_history th
-                JOIN users u ON th.user_id = u.id
-                WHERE th.task_id = ?
-                ORDER BY th.created_at DESC
-            ''', (task_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            try:
+                cursor.execute('''
+                    SELECT th.*, u.full_name as user_name
+                    FROM task_history th
+                    JOIN users u ON th.user_id = u.id
+                    WHERE th.task_id = ?
+                    ORDER BY th.created_at DESC
+                ''', (task_id,))
+                while True:
+                    rows = cursor.fetchmany(_FETCH_BATCH)
+                    if not rows:
+                        return
+                    for row in rows:
+                        yield dict(row)
+            finally:
+                cursor.close()
     
     # СТАТИСТИКА
     def get_user_stats(self, user_id: int) -> Dict:
@@ -531,26 +1065,88 @@ class DatabaseManager:
             ''', (user_id,))
             return dict(cursor.fetchone())
     
+    def get_daily_summary_payload(self, user_id: int, preview_size: int = 3) -> Dict:
+        """
+        Данные ежедневной сводки одним запросом: счётчики задач пользователя
+        и первые preview_size новых задач и задач в работе (в порядке
+        get_tasks_by_user)
+        
+        Returns:
+            Словарь total_tasks, completed_tasks, overdue_tasks, new_count,
+            in_progress_count, new_preview, in_progress_preview (списки
+            словарей title, deadline)
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Первая строка (rn = 0) - счётчики, остальные - превью по статусам
+            cursor.execute('''
+                SELECT 0 AS rn, NULL AS status, NULL AS title, NULL AS deadline,
+                    COUNT(*) AS total_tasks,
+                    COALESCE(SUM(status = 'completed'), 0) AS completed_tasks,
+                    COALESCE(SUM(status = 'overdue'), 0) AS overdue_tasks,
+                    COALESCE(SUM(status = 'new'), 0) AS new_count,
+                    COALESCE(SUM(status = 'in_progress'), 0) AS in_progress_count
+                FROM tasks WHERE assignee_id = ?
+                UNION ALL
+                SELECT rn, status, title, deadline, NULL, NULL, NULL, NULL, NULL FROM (
+                    SELECT status, title, deadline, ROW_NUMBER() OVER (
+                        PARTITION BY status ORDER BY deadline ASC, created_at DESC
+                    ) AS rn
+                    FROM tasks WHERE assignee_id = ? AND status IN ('new', 'in_progress')
+                ) WHERE rn <= ?
+                ORDER BY rn
+            ''', (user_id, user_id, preview_size))
+            rows = cursor.fetchall()
+        
+        payload = {key: rows[0][key] for key in
+                   ('total_tasks', 'completed_tasks', 'overdue_tasks', 'new_count', 'in_progress_count')}
+        payload['new_preview'] = []
+        payload['in_progress_preview'] = []
+        for row in rows[1:]:
+            payload[f"{row['status']}_preview"].append({'title': row['title'], 'deadline': row['deadline']})
+        return payload
+    
+    def get_users_with_stats(self, user_id: int = None) -> List[Dict]:
+        """
+        Активные пользователи (или один пользователь) вместе со статистикой
+        их задач одним запросом, в порядке get_all_users
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            query = '''
+                SELECT u.id, u.first_name, u.last_name,
+                    COUNT(t.id) as total_tasks,
+                    COALESCE(SUM(t.status = 'completed'), 0) as completed_tasks,
+                    COALESCE(SUM(t.status = 'overdue'), 0) as overdue_tasks,
+                    COALESCE(SUM(t.status IN ('new', 'in_progress')), 0) as active_tasks
+                FROM users u
+                LEFT JOIN tasks t ON t.assignee_id = u.id
+                WHERE u.is_active = 1
+            '''
+            params = []
+            if user_id is not None:
+                query += ' AND u.id = ?'
+                params.append(user_id)
+            query += ' GROUP BY u.id ORDER BY u.first_name'
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+    
     def get_general_stats(self) -> Dict:
         """Получение общей статистики"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            # Статистика по задачам и число активных пользователей одним запросом
             cursor.execute('''
                 SELECT 
                     COUNT(*) as total_tasks,
-                    SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_tasks,
-                    SUM(CASE WHEN status = 'overdue' THEN 1 ELSE 0 END) as overdue_tasks,
-                    SUM(CASE WHEN status IN ('new', 'in_progress') THEN 1 ELSE 0 END) as active_tasks,
-                    COUNT(DISTINCT assignee_id) as active_users
+                    SUM(status = 'completed') as completed_tasks,
+                    SUM(status = 'overdue') as overdue_tasks,
+                    SUM(status IN ('new', 'in_progress')) as active_tasks,
+                    COUNT(DISTINCT assignee_id) as active_users,
+                    (SELECT COUNT(*) FROM users WHERE is_active = 1) as total_users
                 FROM tasks
             ''')
-            stats = dict(cursor.fetchone())
-            
-            # Добавляем статистику по пользователям
-            cursor.execute('SELECT COUNT(*) as total_users FROM users WHERE is_active = 1')
-            stats.update(dict(cursor.fetchone()))
-            
-            return stats
+            return dict(cursor.fetchone())
 
 # Создаем глобальный экземпляр менеджера БД
 db = DatabaseManager()
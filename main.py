@@ -4,25 +4,40 @@
 """
 
 import sys
+import atexit
 import logging
+import logging.handlers
 import asyncio
+import multiprocessing
 from pathlib import Path
 
 # Добавляем текущую директорию в PATH
 sys.path.append(str(Path(__file__).parent))
 
 from config import config
+from database import db
 from bot import TaskManagerBot
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Настройка логирования: обработчики пишут в файл и консоль в отдельном потоке,
+# а вызывающий код (в том числе цикл событий) только кладёт запись в очередь.
+# Очередь межпроцессная: процессы отчётов наследуют QueueHandler при fork,
+# и их записи тоже доходят до слушателя
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('bot.log', encoding='utf-8'),
+    logging.StreamHandler(sys.stdout)
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = multiprocessing.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+# Остановка при любом выходе (в том числе sys.exit до запуска бота) дописывает очередь
+atexit.register(_log_listener.stop)
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +70,7 @@ def main():
         logger.error(f"❌ Критическая ошибка: {e}")
         sys.exit(1)
     finally:
+        db.close()
         logger.info("🏁 Бот остановлен")
 
 if __name__ == "__main__":
@@ -4,200 +4,356 @@
 """
 
 import asyncio
+import html
 import logging
+import math
+import time
 from datetime import datetime, timedelta
 from typing import List, Dict
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter, TelegramError
 
 from config import config, EMOJIS
 from database import db
-from utils import format_task, format_datetime, get_current_tashkent_time
+from utils import format_task, format_datetime, parse_db_datetime, utc_now
 
 logger = logging.getLogger(__name__)
 
+# Пауза после ошибки в цикле: удваивается с каждой ошибкой подряд до предела (сек)
+_ERROR_BACKOFF_START = 1
+_ERROR_BACKOFF_MAX = 60
+# Пустые обходы подряд растягивают паузу в _IDLE_BACKOFF_FACTOR раз,
+# но не дальше _IDLE_MAX_INTERVALS интервалов проверки
+_IDLE_BACKOFF_FACTOR = 1.5
+_IDLE_MAX_INTERVALS = 5
+
+# Лимиты Telegram на рассылку: не больше _SEND_RATE сообщений в секунду всего
+# и одного сообщения в _PER_CHAT_INTERVAL секунд в один чат
+_SEND_RATE = 30
+_PER_CHAT_INTERVAL = 1.0
+# Сколько отправок обхода может одновременно ждать ответа Telegram
+_SEND_CONCURRENCY = 30
+# Ответ 429 (RetryAfter): сколько раз за обход повторять отправку и какой
+# запас (сек) добавлять к паузе, которую назвал Telegram
+_RETRY_AFTER_ATTEMPTS = 3
+_RETRY_AFTER_MARGIN = 0.2
+
+# За сколько часов до дедлайна напоминать - вместе с готовым timedelta;
+# напоминание создаётся, когда его время попадает в ближайший час
+_REMINDER_DELTAS = tuple((hours, timedelta(hours=hours)) for hours in config.REMINDER_HOURS_BEFORE)
+_REMINDER_WINDOW = timedelta(hours=1)
+
+# Шаблоны сообщений: эмодзи подставлены один раз при импорте, при отправке -
+# только str.format с данными задачи
+_OVERDUE_MSG = (
+    f"{EMOJIS['warning']} <b>ЗАДАЧА ПРОСРОЧЕНА!</b>\n\n"
+    "{task}\n\n"
+    "Пожалуйста, обновите статус задачи или свяжитесь с руководителем."
+)
+_REMINDER_MSG = (
+    f"{EMOJIS['deadline']} <b>НАПОМИНАНИЕ О ДЕДЛАЙНЕ</b>\n\n"
+    "⏰ До завершения задачи осталось <b>{hours} часов</b>!\n\n"
+    "{task}"
+)
+_ASSIGNED_MSG = (
+    f"{EMOJIS['new']} <b>НОВАЯ ЗАДАЧА НАЗНАЧЕНА</b>\n\n"
+    "{task}\n\n"
+    "Задача ожидает выполнения. Удачи! 💪"
+)
+_STATUS_CHANGED_MSG = (
+    "{emoji} <b>СТАТУС ЗАДАЧИ ИЗМЕНЁН</b>\n\n"
+    "📝 <b>Задача:</b> {title}\n"
+    "📊 <b>Было:</b> {old_status}\n"
+    "📊 <b>Стало:</b> {new_status}\n\n"
+    "🎯 <b>Исполнитель:</b> {assignee}"
+)
+_COMPLETED_SUFFIX = "\n\n🎉 <b>Поздравляем с выполнением задачи!</b>"
+_STATUS_EMOJIS = {
+    'new': EMOJIS['new'],
+    'in_progress': EMOJIS['pending'],
+    'completed': EMOJIS['done'],
+    'overdue': EMOJIS['overdue'],
+    'cancelled': EMOJIS['error']
+}
+_DEADLINE_APPROACHING_MSG = (
+    "{urgency} <b>ДЕДЛАЙН ПРИБЛИЖАЕТСЯ</b>\n\n"
+    "⏰ До завершения задачи осталось: <b>{hours} ч.</b>\n\n"
+    "{task}\n\n"
+    "Не забудьте обновить статус задачи! 📋"
+)
+_DAILY_SUMMARY_HEADER = (
+    f"{EMOJIS['menu']} <b>ЕЖЕДНЕВНАЯ СВОДКА</b>\n\n"
+    "📊 <b>Ваша статистика:</b>\n"
+    "• Всего задач: {total}\n"
+    "• Выполнено: {completed}\n"
+    "• В работе: {in_progress}\n"
+    "• Новых: {new}\n"
+    "• Просрочено: {overdue}\n\n"
+)
+_WEEKLY_REPORT_MSG = (
+    f"{EMOJIS['reports']} <b>ЕЖЕНЕДЕЛЬНЫЙ ОТЧЁТ</b>\n\n"
+    "📅 <b>Период:</b> {start} - {end}\n\n"
+    "📊 <b>Общая статистика:</b>\n"
+    "• Всего задач: {total}\n"
+    "• Выполнено: {completed}\n"
+    "• Активных: {active}\n"
+    "• Просрочено: {overdue}\n\n"
+    "💪 <b>Продуктивность:</b> {rate}%\n\n"
+    "🎯 <b>Продолжайте в том же духе!</b>"
+)
+
 class NotificationManager:
     """Менеджер уведомлений и напоминаний"""
     
     def __init__(self):
         self.bot = None
         self.is_running = False
+        # Пробуждение цикла раньше срока (kick)
+        self._wake = asyncio.Event()
+        self._send_semaphore = asyncio.Semaphore(_SEND_CONCURRENCY)
+        # До какого момента (time.monotonic) отправки стоят после ответа 429
+        self._send_resume_at = 0.0
+        # Когда (time.monotonic) в каждый чат ушла или уйдёт последняя отправка
+        self._chat_last_sent: Dict[int, float] = {}
+        # Подписка на новые уведомления в БД (пока работает цикл)
+        self._db_listener = None
     
     async def start_notification_loop(self, application):
         """Запуск цикла проверки уведомлений"""
         self.bot = application.bot
         self.is_running = True
         
+        # Новые уведомления будят цикл сразу; вставки идут из рабочих потоков,
+        # поэтому событие выставляется через цикл событий. Опрос по интервалу
+        # остаётся страховкой
+        loop = asyncio.get_running_loop()
+        self._db_listener = lambda: loop.call_soon_threadsafe(self.kick)
+        db.add_notification_listener(self._db_listener)
+        
         logger.info("🔔 Служба уведомлений запущена")
         
+        backoff = _ERROR_BACKOFF_START
+        idle_interval = config.NOTIFICATION_CHECK_INTERVAL
         while self.is_running:
             try:
-                await self.check_and_send_notifications()
-                await self.check_overdue_tasks()
-                await self.schedule_deadline_reminders()
+                # Три части обхода независимы: их ожидания БД и Telegram перекрываются
+                # (WAL не блокирует читателей, писатели ждут друг друга по busy timeout)
+                # Одно "сейчас" на весь обход
+                now = utc_now()
+                results = await asyncio.gather(
+                    self.check_and_send_notifications(),
+                    self.check_overdue_tasks(now),
+                    self.schedule_deadline_reminders(now),
+                    return_exceptions=True
+                )
+                errors = [result for result in results if isinstance(result, Exception)]
+                for error in errors:
+                    logger.error(f"Ошибка в цикле уведомлений: {error}")
+                if errors:
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, _ERROR_BACKOFF_MAX)
+                    continue
                 
-                # Ждём указанный интервал
-                await asyncio.sleep(config.NOTIFICATION_CHECK_INTERVAL)
+                sent = results[0]
+                if sent:
+                    # Была работа: следующий обход сразу, пауза - снова базовая
+                    idle_interval = config.NOTIFICATION_CHECK_INTERVAL
+                    timeout = 0
+                else:
+                    timeout = await self._next_wait_timeout(idle_interval)
+                    idle_interval = min(idle_interval * _IDLE_BACKOFF_FACTOR,
+                                        config.NOTIFICATION_CHECK_INTERVAL * _IDLE_MAX_INTERVALS)
+                backoff = _ERROR_BACKOFF_START
                 
             except Exception as e:
                 logger.error(f"Ошибка в цикле уведомлений: {e}")
-                await asyncio.sleep(60)  # Короткая пауза при ошибке
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _ERROR_BACKOFF_MAX)
+                continue
+            
+            # Ждём паузу, срок ближайшего уведомления или kick()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                # Явное пробуждение - признак новой работы: сбрасываем растянутую паузу
+                idle_interval = config.NOTIFICATION_CHECK_INTERVAL
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._wake.clear()
+    
+    async def _next_wait_timeout(self, interval: float) -> float:
+        """Пауза до следующего обхода: не дольше interval"""
+        seconds = await asyncio.to_thread(db.get_seconds_until_next_notification)
+        if seconds is None:
+            return interval
+        return min(max(seconds, 0), interval)
+    
+    def kick(self):
+        """Разбудить цикл уведомлений, не дожидаясь окончания паузы"""
+        self._wake.set()
     
-    async def check_and_send_notifications(self):
-        """Проверка и отправка запланированных уведомлений"""
-        notifications = db.get_pending_notifications()
+    async def check_and_send_notifications(self) -> int:
+        """Проверка и отправка запланированных уведомлений (возвращает число отправленных)"""
+        # Выборки обхода идут в потоке, чтобы не задерживать обработку кнопок
+        notifications = await asyncio.to_thread(db.get_pending_notification_rows)
+        # Отправленные отмечаются одной транзакцией после обхода
+        sent_ids = []
         
-        for notification in notifications:
-            try:
-                await self.send_notification(
-                    telegram_id=notification['telegram_id'],
-                    message=notification['message'],
-                    task_id=notification['task_id']
-                )
-                
-                # Отмечаем уведомление как отправленное
-                db.mark_notification_sent(notification['id'])
-                
-                logger.info(f"Отправлено уведомление пользователю {notification['telegram_id']}")
+        async def send(delay, notif_id, task_id, telegram_id, message):
+            await asyncio.sleep(delay)
+            async with self._send_semaphore:
+                for _ in range(_RETRY_AFTER_ATTEMPTS):
+                    try:
+                        await self.send_notification(
+                            telegram_id=telegram_id,
+                            message=message,
+                            task_id=task_id
+                        )
+                    except RetryAfter:
+                        # send_notification уже выставил паузу и выждет её перед повтором
+                        continue
+                    except Exception as e:
+                        logger.error(f"Ошибка при отправке уведомления {notif_id}: {e}")
+                        return
+                    
+                    sent_ids.append(notif_id)
+                    logger.info(f"Отправлено уведомление пользователю {telegram_id}")
+                    return
                 
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления {notification['id']}: {e}")
+                logger.warning(f"Уведомление {notif_id} отложено до следующего обхода: лимит Telegram")
+        
+        # Отправки идут параллельно, а моменты старта заранее разложены по слотам
+        # длиной 1/_SEND_RATE секунды: в слоте одна отправка, а следующая в тот же
+        # чат - не раньше чем через _PER_CHAT_INTERVAL (остальные чаты занимают промежутки)
+        chat_gap = math.ceil(_PER_CHAT_INTERVAL * _SEND_RATE)
+        taken = set()
+        chat_next_slot: Dict[int, int] = {}
+        sends = []
+        for notification in notifications:
+            telegram_id = notification[2]
+            slot = chat_next_slot.get(telegram_id, 0)
+            while slot in taken:
+                slot += 1
+            taken.add(slot)
+            chat_next_slot[telegram_id] = slot + chat_gap
+            sends.append(send(slot / _SEND_RATE, *notification))
+        
+        try:
+            await asyncio.gather(*sends)
+        finally:
+            # Синхронно: одна короткая транзакция, которая должна пройти и при отмене цикла
+            db.mark_notifications_sent(sent_ids)
+        return len(sent_ids)
     
-    async def check_overdue_tasks(self):
-        """Проверка и обновление просроченных задач"""
+    async def check_overdue_tasks(self, now: datetime = None):
+        """Проверка и обновление просроченных задач (now - время обхода, UTC)"""
+        now = now or utc_now()
         # Обновляем статус просроченных задач
-        db.update_overdue_tasks()
+        await asyncio.to_thread(db.update_overdue_tasks)
         
-        # Получаем просроченные задачи для уведомлений
-        overdue_tasks = db.get_overdue_tasks()
+        # Только просроченные задачи, о которых ещё не уведомляли (уведомление
+        # 'deadline' шлётся единожды и остаётся в истории)
+        overdue_tasks = await asyncio.to_thread(db.get_overdue_tasks_without_notification)
         
-        for task in overdue_tasks:
-            # Шлём единожды: если уже есть уведомление типа 'deadline' по этой задаче, пропускаем
-            if db.exists_notification_by_task_type(task['id'], 'deadline'):
-                continue
-
-            if task['assignee_telegram_id']:
-                assignee = db.get_user_by_telegram_id(task['assignee_telegram_id'])
-                if assignee:
-                    # Создаём запись уведомления (история + предотвращение дублей)
-                    message = (
-                        f"{EMOJIS['warning']} **ЗАДАЧА ПРОСРОЧЕНА!**\n\n"
-                        f"{format_task(task, detailed=True)}\n\n"
-                        f"Пожалуйста, обновите статус задачи или свяжитесь с руководителем."
-                    )
-                    notif_id = db.create_notification(
-                        user_id=assignee['id'],
-                        task_id=task['id'],
-                        notification_type='deadline',
-                        message=message,
-                        scheduled_at=get_current_tashkent_time()
-                    )
-                    # Отправляем немедленно и помечаем отправленным
-                    await self.send_notification(
-                        telegram_id=task['assignee_telegram_id'],
-                        message=message,
-                        task_id=task['id']
-                    )
-                    db.mark_notification_sent(notif_id)
+        # Исполнитель пришёл из JOIN с users: его id уже есть в каждой строке
+        alerts = [
+            (task['assignee_id'], task['id'], _OVERDUE_MSG.format(task=format_task(task, detailed=True, now=now)))
+            for task in overdue_tasks
+        ]
+        
+        # Уведомления создаются к отправке сейчас; доставляет их обычный обход
+        # (с ограничением скорости), который подписка на БД запускает без паузы
+        await asyncio.to_thread(db.create_notifications_if_absent, 'deadline', alerts)
     
-    async def schedule_deadline_reminders(self):
-        """Планирование напоминаний о дедлайнах"""
-        # Получаем активные задачи с дедлайнами
-        active_tasks = db.get_all_tasks(status='new')
-        active_tasks.extend(db.get_all_tasks(status='in_progress'))
+    async def schedule_deadline_reminders(self, now: datetime = None):
+        """Планирование напоминаний о дедлайнах (now - время обхода, UTC)"""
+        # Напоминания отключены в конфигурации - обращаться к БД незачем
+        if not _REMINDER_DELTAS:
+            return
+        now = now or utc_now()
         
-        now = datetime.utcnow()
+        # Только задачи, у которых в ближайший час наступает время напоминания
+        active_tasks = await asyncio.to_thread(
+            db.get_tasks_needing_reminder, now, config.REMINDER_HOURS_BEFORE
+        )
         
+        window_end = now + _REMINDER_WINDOW
+        reminders = []
         for task in active_tasks:
-            if not task['deadline'] or not task['assignee_id']:
-                continue
-            
-            deadline = datetime.fromisoformat(task['deadline'].replace('Z', '+00:00'))
+            deadline = parse_db_datetime(task['deadline'])
+            task_text = format_task(task, detailed=True, now=now)
             
             # Планируем напоминания за определённое время до дедлайна
-            for hours_before in config.REMINDER_HOURS_BEFORE:
-                reminder_time = deadline - timedelta(hours=hours_before)
+            for hours_before, delta in _REMINDER_DELTAS:
+                reminder_time = deadline - delta
                 
                 # Проверяем, нужно ли создать напоминание
-                if reminder_time > now and reminder_time <= now + timedelta(hours=1):
-                    await self.create_deadline_reminder(task, hours_before, reminder_time)
-    
-    async def create_deadline_reminder(self, task: Dict, hours_before: int, reminder_time: datetime):
-        """Создание напоминания о дедлайне"""
-        assignee = db.get_user_by_telegram_id(task['assignee_telegram_id'])
-        if not assignee:
-            return
-        
-        # Проверяем, не создано ли уже такое напоминание
-        # Проверяем, не создано ли уже такое напоминание по задаче и типу
-        existing_notifications = db.get_unsent_notifications_by_task_type(task['id'], 'reminder')
-        for notif in existing_notifications:
-            if f"{hours_before} часов" in notif['message']:
-                return  # Напоминание уже создано
+                if now < reminder_time <= window_end:
+                    reminders.append((
+                        task['assignee_id'], task['id'], hours_before,
+                        _REMINDER_MSG.format(hours=hours_before, task=task_text), reminder_time
+                    ))
         
-        message = (
-            f"{EMOJIS['deadline']} **НАПОМИНАНИЕ О ДЕДЛАЙНЕ**\n\n"
-            f"⏰ До завершения задачи осталось **{hours_before} часов**!\n\n"
-            f"{format_task(task, detailed=True)}"
-        )
-        
-        db.create_notification(
-            user_id=assignee['id'],
-            task_id=task['id'],
-            notification_type='reminder',
-            message=message,
-            scheduled_at=reminder_time
-        )
-        
-        logger.info(f"Создано напоминание для задачи {task['id']} за {hours_before} часов")
+        # Одна вставка на обход; уже созданные напоминания пропускает сама БД
+        created = await asyncio.to_thread(db.create_reminders_if_absent, reminders)
+        if created:
+            logger.info(f"Создано напоминаний о дедлайнах: {created}")
     
-    async def send_notification(self, telegram_id: int, message: str, task_id: int = None):
-        """Отправка уведомления пользователю"""
+    async def send_notification(self, telegram_id: int, message: str, task_id: int = None, *,
+                                silent: bool = False):
+        """Отправка уведомления пользователю (silent - без звука, для несрочных сводок)"""
         if not self.bot:
             logger.error("Bot не инициализирован")
             return
         
+        # Момент отправки: после паузы, названной Telegram в ответе 429, и не
+        # раньше чем через _PER_CHAT_INTERVAL после предыдущей отправки в этот чат
+        # (в том числе из прошлого обхода или обработчика). Момент резервируется
+        # сразу, поэтому параллельные отправки в один чат выстраиваются в очередь
+        now = time.monotonic()
+        send_at = max(now, self._send_resume_at,
+                      self._chat_last_sent.get(telegram_id, now - _PER_CHAT_INTERVAL) + _PER_CHAT_INTERVAL)
+        self._chat_last_sent[telegram_id] = send_at
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+        
         try:
             await self.bot.send_message(
                 chat_id=telegram_id,
                 text=message,
-                parse_mode='Markdown'
+                parse_mode=ParseMode.HTML,
+                disable_notification=silent
             )
+        except RetryAfter as e:
+            self._send_resume_at = max(
+                self._send_resume_at, time.monotonic() + e.retry_after + _RETRY_AFTER_MARGIN
+            )
+            logger.warning(f"Telegram ограничил отправку, пауза {e.retry_after} сек")
+            raise
         except TelegramError as e:
             logger.error(f"Ошибка при отправке уведомления пользователю {telegram_id}: {e}")
             raise
     
     async def notify_task_assigned(self, task: Dict, assignee_telegram_id: int):
         """Уведомление о назначении задачи"""
-        message = (
-            f"{EMOJIS['new']} **НОВАЯ ЗАДАЧА НАЗНАЧЕНА**\n\n"
-            f"{format_task(task, detailed=True)}\n\n"
-            f"Задача ожидает выполнения. Удачи! 💪"
-        )
+        message = _ASSIGNED_MSG.format(task=format_task(task, detailed=True))
         
         await self.send_notification(assignee_telegram_id, message, task['id'])
     
     async def notify_task_status_changed(self, task: Dict, old_status: str, new_status: str, 
                                        creator_telegram_id: int):
         """Уведомление об изменении статуса задачи"""
-        status_emojis = {
-            'new': EMOJIS['new'],
-            'in_progress': EMOJIS['pending'],
-            'completed': EMOJIS['done'],
-            'overdue': EMOJIS['overdue'],
-            'cancelled': EMOJIS['error']
-        }
-        
-        message = (
-            f"{status_emojis.get(new_status, EMOJIS['info'])} **СТАТУС ЗАДАЧИ ИЗМЕНЁН**\n\n"
-            f"📝 **Задача:** {task['title']}\n"
-            f"📊 **Было:** {old_status}\n"
-            f"📊 **Стало:** {new_status}\n\n"
-            f"🎯 **Исполнитель:** {task['assignee_name']}"
+        message = _STATUS_CHANGED_MSG.format(
+            emoji=_STATUS_EMOJIS.get(new_status, EMOJIS['info']),
+            title=html.escape(task['title']),
+            old_status=old_status,
+            new_status=new_status,
+            assignee=html.escape(task['assignee_name'] or 'Не назначен')
         )
         
         if new_status == 'completed':
-            message += f"\n\n🎉 **Поздравляем с выполнением задачи!**"
+            message += _COMPLETED_SUFFIX
         
         await self.send_notification(creator_telegram_id, message, task['id'])
     
@@ -208,78 +364,78 @@ class NotificationManager:
         
         urgency_level = "🔥" if hours_left <= 1 else "⚠️" if hours_left <= 6 else "🕐"
         
-        message = (
-            f"{urgency_level} **ДЕДЛАЙН ПРИБЛИЖАЕТСЯ**\n\n"
-            f"⏰ До завершения задачи осталось: **{hours_left} ч.**\n\n"
-            f"{format_task(task, detailed=True)}\n\n"
-            f"Не забудьте обновить статус задачи! 📋"
+        message = _DEADLINE_APPROACHING_MSG.format(
+            urgency=urgency_level, hours=hours_left, task=format_task(task, detailed=True)
         )
         
         await self.send_notification(task['assignee_telegram_id'], message, task['id'])
     
     async def send_daily_summary(self, user_telegram_id: int, user_id: int):
         """Отправка ежедневной сводки"""
-        user_stats = db.get_user_stats(user_id)
-        active_tasks = db.get_tasks_by_user(user_id, 'in_progress')
-        new_tasks = db.get_tasks_by_user(user_id, 'new')
+        # Счётчики и первые 3 задачи каждого статуса - одним запросом
+        summary = await asyncio.to_thread(db.get_daily_summary_payload, user_id)
+        new_count = summary['new_count']
+        in_progress_count = summary['in_progress_count']
         
-        message = (
-            f"{EMOJIS['menu']} **ЕЖЕДНЕВНАЯ СВОДКА**\n\n"
-            f"📊 **Ваша статистика:**\n"
-            f"• Всего задач: {user_stats['total_tasks']}\n"
-            f"• Выполнено: {user_stats['completed_tasks']}\n"
-            f"• В работе: {len(active_tasks)}\n"
-            f"• Новых: {len(new_tasks)}\n"
-            f"• Просрочено: {user_stats['overdue_tasks']}\n\n"
-        )
+        # Части сообщения собираются в список и склеиваются один раз
+        parts = [_DAILY_SUMMARY_HEADER.format(
+            total=summary['total_tasks'],
+            completed=summary['completed_tasks'],
+            in_progress=in_progress_count,
+            new=new_count,
+            overdue=summary['overdue_tasks']
+        )]
         
-        if new_tasks:
-            message += f"🆕 **Новые задачи ({len(new_tasks)}):**\n"
-            for task in new_tasks[:3]:  # Показываем только первые 3
+        if new_count:
+            parts.append(f"🆕 <b>Новые задачи ({new_count}):</b>\n")
+            for task in summary['new_preview']:
                 deadline_str = format_datetime(task['deadline'], show_time=False) if task['deadline'] else "Без дедлайна"
-                message += f"• {task['title'][:30]}... ({deadline_str})\n"
+                parts.append(f"• {html.escape(task['title'][:30])}... ({deadline_str})\n")
             
-            if len(new_tasks) > 3:
-                message += f"• ... и ещё {len(new_tasks) - 3} задач\n"
-            message += "\n"
+            if new_count > 3:
+                parts.append(f"• ... и ещё {new_count - 3} задач\n")
+            parts.append("\n")
         
-        if active_tasks:
-            message += f"🔄 **В работе ({len(active_tasks)}):**\n"
-            for task in active_tasks[:3]:
+        if in_progress_count:
+            parts.append(f"🔄 <b>В работе ({in_progress_count}):</b>\n")
+            for task in summary['in_progress_preview']:
                 deadline_str = format_datetime(task['deadline'], show_time=False) if task['deadline'] else "Без дедлайна"
-                message += f"• {task['title'][:30]}... ({deadline_str})\n"
+                parts.append(f"• {html.escape(task['title'][:30])}... ({deadline_str})\n")
             
-            if len(active_tasks) > 3:
-                message += f"• ... и ещё {len(active_tasks) - 3} задач\n"
+            if in_progress_count > 3:
+                parts.append(f"• ... и ещё {in_progress_count - 3} задач\n")
         
-        message += f"\n🚀 **Удачного дня!**"
+        parts.append("\n🚀 <b>Удачного дня!</b>")
         
-        await self.send_notification(user_telegram_id, message)
+        await self.send_notification(user_telegram_id, "".join(parts), silent=True)
     
     async def send_weekly_report(self, user_telegram_id: int, user_id: int):
         """Отправка еженедельного отчёта"""
         # Статистика за неделю
-        week_ago = datetime.utcnow() - timedelta(days=7)
+        now = utc_now()
+        week_ago = now - timedelta(days=7)
         
         # Здесь можно добавить специальные запросы для статистики за неделю
-        user_stats = db.get_user_stats(user_id)
+        user_stats = await asyncio.to_thread(db.get_user_stats, user_id)
         
-        message = (
-            f"{EMOJIS['reports']} **ЕЖЕНЕДЕЛЬНЫЙ ОТЧЁТ**\n\n"
-            f"📅 **Период:** {format_datetime(week_ago, show_time=False)} - {format_datetime(get_current_tashkent_time(), show_time=False)}\n\n"
-            f"📊 **Общая статистика:**\n"
-            f"• Всего задач: {user_stats['total_tasks']}\n"
-            f"• Выполнено: {user_stats['completed_tasks']}\n"
-            f"• Активных: {user_stats['active_tasks']}\n"
-            f"• Просрочено: {user_stats['overdue_tasks']}\n\n"
-            f"💪 **Продуктивность:** {int(user_stats['completed_tasks'] / max(user_stats['total_tasks'], 1) * 100)}%\n\n"
-            f"🎯 **Продолжайте в том же духе!**"
+        message = _WEEKLY_REPORT_MSG.format(
+            start=format_datetime(week_ago, show_time=False),
+            end=format_datetime(now, show_time=False),
+            total=user_stats['total_tasks'],
+            completed=user_stats['completed_tasks'],
+            active=user_stats['active_tasks'],
+            overdue=user_stats['overdue_tasks'],
+            rate=int(user_stats['completed_tasks'] / max(user_stats['total_tasks'], 1) * 100)
         )
         
-        await self.send_notification(user_telegram_id, message)
+        await self.send_notification(user_telegram_id, message, silent=True)
     
     def stop(self):
         """Остановка службы уведомлений"""
         self.is_running = False
+        if self._db_listener:
+            db.remove_notification_listener(self._db_listener)
+            self._db_listener = None
+        self.kick()
         logger.info("🔕 Служба уведомлений остановлена")
 
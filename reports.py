@@ -5,34 +5,77 @@
 
 import os
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-import pandas as pd
+from collections import Counter
+from typing import Iterable, List, Dict, Optional, Sequence, Tuple
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # headless backend for servers/Windows without GUI
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import PolyCollection
 from matplotlib.patches import Rectangle
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+try:
+    import xlsxwriter
+except ImportError:
+    # Не критично: без xlsxwriter книга пишется через openpyxl в режиме write_only
+    xlsxwriter = None
 
 from config import config, TASK_STATUS, TASK_PRIORITY
 from database import db
-from utils import format_datetime, get_current_tashkent_time
+from utils import format_datetime, get_current_tashkent_time, parse_db_datetime, utc_now
+
+# Стиль диаграмм применяется один раз при импорте, а не при каждом построении
+plt.style.use('seaborn-v0_8-whitegrid')
 
-# Настройка для поддержки русского языка в matplotlib
+# Настройка для поддержки русского языка в matplotlib (после стиля: он задаёт свой шрифт)
 plt.rcParams['font.family'] = ['DejaVu Sans', 'Liberation Sans', 'Arial Unicode MS']
 
 logger = logging.getLogger(__name__)
 
+# Быстрое сжатие PNG: диаграммы отправляются в Telegram, а не в печать
+_PNG_PIL_KWARGS = {'compress_level': 1}
+
+# Заголовки листов Excel
+_TASKS_SHEET_HEADER = (
+    'ID', 'Название', 'Описание', 'Создатель', 'Исполнитель', 'Статус', 'Приоритет',
+    'Дата создания', 'Дедлайн', 'Дата выполнения', 'Дней на выполнение', 'Просрочено'
+)
+_STATISTICS_SHEET_HEADER = ('Показатель', 'Значение')
+_USER_ANALYTICS_SHEET_HEADER = (
+    'Исполнитель', 'Всего задач', 'Выполнено', 'Просрочено', 'Активных', 'Процент выполнения'
+)
+# Ширина колонки: длина самого длинного значения плюс запас, но не больше предела
+_EXCEL_COLUMN_PADDING = 2
+_EXCEL_MAX_COLUMN_WIDTH = 50
+# Параметры книги xlsxwriter: построчная запись, ячейки - как у openpyxl
+_XLSXWRITER_OPTIONS = {'constant_memory': True, 'strings_to_urls': False, 'strings_to_formulas': False}
+# Оформление заголовков (как у pandas.to_excel)
+_XLSXWRITER_HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+_THIN_SIDE = Side(style='thin')
+_EXCEL_HEADER_FONT = Font(bold=True)
+_EXCEL_HEADER_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+_EXCEL_HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+# Папки, уже созданные в этом процессе
+_CREATED_DIRS = set()
+
+def _ensure_dir(path: str) -> str:
+    """Создаёт папку при первой записи в неё и возвращает путь"""
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+    return path
+
 class ReportGenerator:
     """Генератор отчётов и диаграмм"""
     
-    def __init__(self):
-        # Создаём папки для экспорта если их нет
-        os.makedirs(config.EXPORT_FOLDER, exist_ok=True)
-        os.makedirs(config.CHARTS_FOLDER, exist_ok=True)
-    
     def create_excel_report(self, tasks: List[Dict], filename: str = None) -> str:
         """
         Создание Excel отчёта
@@ -48,43 +91,34 @@ class ReportGenerator:
             timestamp = get_current_tashkent_time().strftime("%Y%m%d_%H%M%S")
             filename = f"task_report_{timestamp}.xlsx"
         
-        filepath = os.path.join(config.EXPORT_FOLDER, filename)
+        filepath = os.path.join(_ensure_dir(config.EXPORT_FOLDER), filename)
+        
+        # Строки основного листа - кортежи в порядке _TASKS_SHEET_HEADER
+        # (без промежуточных словарей и DataFrame)
+        task_rows = [
+            (
+                task['id'],
+                task['title'],
+                task['description'] or '',
+                task['creator_name'] or '',
+                task['assignee_name'] or 'Не назначен',
+                TASK_STATUS[task['status']],
+                TASK_PRIORITY[task['priority']],
+                self._format_date_for_excel(task['created_at']),
+                self._format_date_for_excel(task['deadline']),
+                self._format_date_for_excel(task['completed_at']),
+                self._calculate_completion_days(task),
+                'Да' if task['status'] == 'overdue' else 'Нет'
+            )
+            for task in tasks
+        ]
         
-        # Подготавливаем данные для Excel
-        data = []
-        for task in tasks:
-            row = {
-                'ID': task['id'],
-                'Название': task['title'],
-                'Описание': task['description'] or '',
-                'Создатель': task['creator_name'] or '',
-                'Исполнитель': task['assignee_name'] or 'Не назначен',
-                'Статус': TASK_STATUS[task['status']],
-                'Приоритет': TASK_PRIORITY[task['priority']],
-                'Дата создания': self._format_date_for_excel(task['created_at']),
-                'Дедлайн': self._format_date_for_excel(task['deadline']),
-                'Дата выполнения': self._format_date_for_excel(task['completed_at']),
-                'Дней на выполнение': self._calculate_completion_days(task),
-                'Просрочено': 'Да' if task['status'] == 'overdue' else 'Нет'
-            }
-            data.append(row)
-        
-        # Создаём DataFrame
-        df = pd.DataFrame(data)
-        
-        # Создаём Excel файл с несколькими листами
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            # Основной лист с задачами
-            df.to_excel(writer, sheet_name='Задачи', index=False)
-            
-            # Лист со статистикой
-            self._create_statistics_sheet(writer, tasks)
-            
-            # Лист с аналитикой по пользователям
-            self._create_user_analytics_sheet(writer, tasks)
-            
-            # Форматируем листы
-            self._format_excel_sheets(writer)
+        # Excel файл с несколькими листами: задачи, статистика, аналитика по пользователям
+        self._write_excel(filepath, (
+            ('Задачи', _TASKS_SHEET_HEADER, task_rows),
+            ('Статистика', _STATISTICS_SHEET_HEADER, self._statistics_rows(tasks)),
+            ('Аналитика по пользователям', _USER_ANALYTICS_SHEET_HEADER, self._user_analytics_rows(tasks))
+        ))
         
         logger.info(f"Excel отчёт создан: {filepath}")
         return filepath
@@ -104,7 +138,7 @@ class ReportGenerator:
             timestamp = get_current_tashkent_time().strftime("%Y%m%d_%H%M%S")
             filename = f"gantt_chart_{timestamp}.png"
         
-        filepath = os.path.join(config.CHARTS_FOLDER, filename)
+        filepath = os.path.join(_ensure_dir(config.CHARTS_FOLDER), filename)
         
         # Фильтруем задачи с дедлайнами
         valid_tasks = [task for task in tasks if task['deadline']]
@@ -118,37 +152,25 @@ class ReportGenerator:
             ax.set_ylim(0, 1)
             ax.axis('off')
             plt.tight_layout()
-            plt.savefig(filepath, dpi=300, bbox_inches='tight')
+            plt.savefig(filepath, dpi=config.CHART_DPI, bbox_inches='tight', pil_kwargs=_PNG_PIL_KWARGS)
             plt.close()
             return filepath
         
-        # Подготавливаем данные
-        gantt_data = []
-        for task in valid_tasks:
-            start_date = datetime.fromisoformat(task['created_at'].replace('Z', '+00:00'))
-            deadline = datetime.fromisoformat(task['deadline'].replace('Z', '+00:00'))
-            
-            # Если задача выполнена, используем дату выполнения
-            if task['completed_at']:
-                end_date = datetime.fromisoformat(task['completed_at'].replace('Z', '+00:00'))
-            else:
-                end_date = min(deadline, get_current_tashkent_time())
-            
-            gantt_data.append({
-                'task': task['title'][:30] + ('...' if len(task['title']) > 30 else ''),
-                'start': start_date,
-                'end': end_date,
-                'deadline': deadline,
-                'status': task['status'],
-                'assignee': task['assignee_name'] or 'Не назначен'
-            })
-        
-        # Сортируем по дедлайну
-        gantt_data.sort(key=lambda x: x['deadline'])
+        # Подготавливаем данные: колонки-массивы datetime64, отсортированные по дедлайну
+        deadlines = np.array([parse_db_datetime(task['deadline']) for task in valid_tasks], dtype='datetime64[us]')
+        order = np.argsort(deadlines, kind='stable')
+        valid_tasks = [valid_tasks[i] for i in order]
+        deadlines = deadlines[order]
+        starts = np.array([parse_db_datetime(task['created_at']) for task in valid_tasks], dtype='datetime64[us]')
+        completed = np.array([parse_db_datetime(task['completed_at']) if task['completed_at'] else None
+                              for task in valid_tasks], dtype='datetime64[us]')
+        
+        # Если задача выполнена, полоса до даты выполнения, иначе - до дедлайна,
+        # но не дальше текущего момента (все отметки - в UTC, как в БД)
+        ends = np.where(np.isnat(completed), np.minimum(deadlines, np.datetime64(utc_now(), 'us')), completed)
         
         # Создаём диаграмму (улучшенный стиль)
-        fig, ax = plt.subplots(figsize=(16, max(8, len(gantt_data) * 0.6)))
-        plt.style.use('seaborn-v0_8-whitegrid')
+        fig, ax = plt.subplots(figsize=(16, max(8, len(valid_tasks) * 0.6)))
         
         # Цвета для разных статусов
         status_colors = {
@@ -159,31 +181,35 @@ class ReportGenerator:
             'cancelled': '#808080'    # Серый
         }
         
-        y_pos = range(len(gantt_data))
-        
-        for i, task_data in enumerate(gantt_data):
-            start = task_data['start']
-            end = task_data['end']
-            deadline = task_data['deadline']
-            status = task_data['status']
-            
-            # Основная полоса задачи (используем реальную длительность в днях/часах)
-            duration = (end - start).total_seconds() / (24*3600)
-            color = status_colors.get(status, '#808080')
-            bar = ax.barh(i, duration, left=start, height=0.5,
-                          color=color, alpha=0.9, edgecolor='black', linewidth=0.6)
-            
-            # Отмечаем дедлайн вертикальной линией
-            ax.axvline(x=deadline, ymin=(i-0.35)/len(gantt_data), ymax=(i+0.35)/len(gantt_data), 
-                      color='red', linewidth=2.2, alpha=0.85)
-            
-            # Добавляем текст с именем исполнителя
-            ax.text(start + timedelta(days=duration/2), i, task_data['assignee'], 
+        y_pos = range(len(valid_tasks))
+        # Даты в числовом формате matplotlib (дни), одним вызовом на колонку
+        starts = mdates.date2num(starts)
+        ends = mdates.date2num(ends)
+        deadlines = mdates.date2num(deadlines)
+        
+        # Полосы задач (реальная длительность) - одна коллекция прямоугольников
+        # вместо отдельного barh на задачу
+        bars = PolyCollection(
+            [((start, i - 0.25), (start, i + 0.25), (end, i + 0.25), (end, i - 0.25))
+             for i, start, end in zip(y_pos, starts, ends)],
+            facecolors=[status_colors.get(task['status'], '#808080') for task in valid_tasks],
+            alpha=0.9, edgecolors='black', linewidths=0.6
+        )
+        ax.add_collection(bars)
+        ax.autoscale_view()
+        
+        # Дедлайны - вертикальные отрезки на уровне своих задач, одним вызовом
+        ax.vlines(deadlines, [i - 0.35 for i in y_pos], [i + 0.35 for i in y_pos],
+                  colors='red', linewidth=2.2, alpha=0.85)
+        
+        # Добавляем текст с именем исполнителя
+        for i, start, end, task in zip(y_pos, starts, ends, valid_tasks):
+            ax.text((start + end) / 2, i, task['assignee_name'] or 'Не назначен', 
                    ha='center', va='center', fontsize=9, fontweight='bold')
         
         # Настраиваем оси
         ax.set_yticks(y_pos)
-        ax.set_yticklabels([task['task'] for task in gantt_data])
+        ax.set_yticklabels([task['title'][:30] + ('...' if len(task['title']) > 30 else '') for task in valid_tasks])
         ax.invert_yaxis()
         
         # Форматируем ось времени
@@ -212,7 +238,7 @@ class ReportGenerator:
         ax.grid(True, alpha=0.35, axis='x')
         
         plt.tight_layout()
-        plt.savefig(filepath, dpi=300, bbox_inches='tight')
+        plt.savefig(filepath, dpi=config.CHART_DPI, bbox_inches='tight', pil_kwargs=_PNG_PIL_KWARGS)
         plt.close()
         
         logger.info(f"Диаграмма Ганта создана: {filepath}")
@@ -224,24 +250,12 @@ class ReportGenerator:
             timestamp = get_current_tashkent_time().strftime("%Y%m%d_%H%M%S")
             filename = f"user_performance_{timestamp}.png"
         
-        filepath = os.path.join(config.CHARTS_FOLDER, filename)
-        
-        if user_id:
-            # Получаем пользователя по внутреннему ID
-            try:
-                # добавим вспомогательный метод через обход (получим всех и фильтруем)
-                users = [u for u in db.get_all_users() if u['id'] == user_id]
-            except Exception:
-                users = []
-        else:
-            users = db.get_all_users()
-        
-        # Собираем статистику по пользователям
-        user_stats = []
-        for user in users:
-            stats = db.get_user_stats(user['id'])
-            stats['name'] = f"{user['first_name']} {user['last_name']}"
-            user_stats.append(stats)
+        filepath = os.path.join(_ensure_dir(config.CHARTS_FOLDER), filename)
+        
+        # Пользователи вместе со статистикой одним запросом
+        user_stats = db.get_users_with_stats(user_id or None)
+        for stats in user_stats:
+            stats['name'] = f"{stats['first_name']} {stats['last_name']}"
         
         if not user_stats:
             return self._create_empty_chart(filepath, "Нет данных о пользователях")
@@ -284,7 +298,7 @@ class ReportGenerator:
         plt.setp(ax4.xaxis.get_majorticklabels(), rotation=45)
         
         plt.tight_layout()
-        plt.savefig(filepath, dpi=300, bbox_inches='tight')
+        plt.savefig(filepath, dpi=config.CHART_DPI, bbox_inches='tight', pil_kwargs=_PNG_PIL_KWARGS)
         plt.close()
         
         logger.info(f"График производительности создан: {filepath}")
@@ -296,7 +310,7 @@ class ReportGenerator:
             timestamp = get_current_tashkent_time().strftime("%Y%m%d_%H%M%S")
             filename = f"status_distribution_{timestamp}.png"
         
-        filepath = os.path.join(config.CHARTS_FOLDER, filename)
+        filepath = os.path.join(_ensure_dir(config.CHARTS_FOLDER), filename)
         
         # Подсчитываем статусы
         status_counts = {}
@@ -326,7 +340,7 @@ class ReportGenerator:
             autotext.set_fontweight('bold')
         
         plt.tight_layout()
-        plt.savefig(filepath, dpi=300, bbox_inches='tight')
+        plt.savefig(filepath, dpi=config.CHART_DPI, bbox_inches='tight', pil_kwargs=_PNG_PIL_KWARGS)
         plt.close()
         
         logger.info(f"Диаграмма распределения статусов создана: {filepath}")
@@ -338,7 +352,8 @@ class ReportGenerator:
             return ''
         
         try:
-            dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+            # Разбор кэшируется: те же отметки времени уже разбирались для отчётов и уведомлений
+            dt = parse_db_datetime(date_str)
             return dt.strftime('%d.%m.%Y %H:%M')
         except:
             return str(date_str)
@@ -349,94 +364,138 @@ class ReportGenerator:
             return ''
         
         try:
-            created = datetime.fromisoformat(task['created_at'].replace('Z', '+00:00'))
-            completed = datetime.fromisoformat(task['completed_at'].replace('Z', '+00:00'))
+            created = parse_db_datetime(task['created_at'])
+            completed = parse_db_datetime(task['completed_at'])
             days = (completed - created).days
             return str(days)
         except:
             return ''
     
-    def _create_statistics_sheet(self, writer, tasks: List[Dict]):
-        """Создание листа со статистикой"""
+    def _statistics_rows(self, tasks: List[Dict]) -> List[Tuple]:
+        """Строки листа со статистикой"""
+        # По одному проходу для статусов и приоритетов
+        status_counts = Counter(task['status'] for task in tasks)
+        priority_stats = Counter(task['priority'] for task in tasks)
+        
         # Общая статистика
         total_tasks = len(tasks)
-        completed_tasks = len([t for t in tasks if t['status'] == 'completed'])
-        overdue_tasks = len([t for t in tasks if t['status'] == 'overdue'])
-        active_tasks = len([t for t in tasks if t['status'] in ['new', 'in_progress']])
-        
-        # Статистика по приоритетам
-        priority_stats = {}
-        for priority in TASK_PRIORITY.keys():
-            priority_stats[priority] = len([t for t in tasks if t['priority'] == priority])
-        
-        # Создаём DataFrame со статистикой
-        stats_data = [
-            ['Общая статистика', ''],
-            ['Всего задач', total_tasks],
-            ['Выполнено', completed_tasks],
-            ['Просрочено', overdue_tasks],
-            ['Активных', active_tasks],
-            ['Процент выполнения', f"{(completed_tasks/max(total_tasks, 1)*100):.1f}%"],
-            ['', ''],
-            ['Статистика по приоритетам', ''],
-            ['Высокий приоритет', priority_stats.get('high', 0)],
-            ['Средний приоритет', priority_stats.get('medium', 0)],
-            ['Низкий приоритет', priority_stats.get('low', 0)]
+        completed_tasks = status_counts['completed']
+        overdue_tasks = status_counts['overdue']
+        active_tasks = status_counts['new'] + status_counts['in_progress']
+        
+        return [
+            ('Общая статистика', ''),
+            ('Всего задач', total_tasks),
+            ('Выполнено', completed_tasks),
+            ('Просрочено', overdue_tasks),
+            ('Активных', active_tasks),
+            ('Процент выполнения', f"{(completed_tasks/max(total_tasks, 1)*100):.1f}%"),
+            ('', ''),
+            ('Статистика по приоритетам', ''),
+            ('Высокий приоритет', priority_stats.get('high', 0)),
+            ('Средний приоритет', priority_stats.get('medium', 0)),
+            ('Низкий приоритет', priority_stats.get('low', 0))
         ]
-        
-        stats_df = pd.DataFrame(stats_data, columns=['Показатель', 'Значение'])
-        stats_df.to_excel(writer, sheet_name='Статистика', index=False)
     
-    def _create_user_analytics_sheet(self, writer, tasks: List[Dict]):
-        """Создание листа с аналитикой по пользователям"""
-        # Группируем задачи по исполнителям
-        user_tasks = {}
-        for task in tasks:
-            assignee = task['assignee_name'] or 'Не назначен'
-            if assignee not in user_tasks:
-                user_tasks[assignee] = []
-            user_tasks[assignee].append(task)
+    def _user_analytics_rows(self, tasks: List[Dict]) -> List[Tuple]:
+        """Строки листа с аналитикой по пользователям"""
+        # Один проход по задачам: счётчик пар (исполнитель, статус); исполнители
+        # идут в порядке первого появления, как раньше при группировке
+        pair_counts = Counter((task['assignee_name'] or 'Не назначен', task['status']) for task in tasks)
+        user_status_counts: Dict[str, Counter] = {}
+        for (user, status), count in pair_counts.items():
+            user_status_counts.setdefault(user, Counter())[status] = count
         
         # Создаём статистику по пользователям
         user_analytics = []
-        for user, user_task_list in user_tasks.items():
-            total = len(user_task_list)
-            completed = len([t for t in user_task_list if t['status'] == 'completed'])
-            overdue = len([t for t in user_task_list if t['status'] == 'overdue'])
-            active = len([t for t in user_task_list if t['status'] in ['new', 'in_progress']])
+        for user, status_counts in user_status_counts.items():
+            total = status_counts.total()
+            completed = status_counts['completed']
+            overdue = status_counts['overdue']
+            active = status_counts['new'] + status_counts['in_progress']
             
-            user_analytics.append({
-                'Исполнитель': user,
-                'Всего задач': total,
-                'Выполнено': completed,
-                'Просрочено': overdue,
-                'Активных': active,
-                'Процент выполнения': f"{(completed/max(total, 1)*100):.1f}%"
-            })
-        
-        analytics_df = pd.DataFrame(user_analytics)
-        analytics_df.to_excel(writer, sheet_name='Аналитика по пользователям', index=False)
+            user_analytics.append((
+                user,
+                total,
+                completed,
+                overdue,
+                active,
+                f"{(completed/max(total, 1)*100):.1f}%"
+            ))
+        
+        return user_analytics
     
-    def _format_excel_sheets(self, writer):
-        """Форматирование Excel листов"""
-        # Здесь можно добавить форматирование: ширину колонок, цвета, границы и т.д.
-        for sheet_name in writer.sheets:
-            worksheet = writer.sheets[sheet_name]
+    def _write_excel(self, filepath: str, sheets: Iterable[Tuple[str, Sequence[str], List[Tuple]]]):
+        """
+        Запись листов (название, заголовок, строки) в Excel файл
+        
+        Строки уходят в XML потоком, без модели всех ячеек в памяти: через
+        xlsxwriter в режиме constant_memory, если он установлен, иначе через
+        openpyxl в режиме write_only. Ширины колонок считаются по строкам
+        заранее - в обоих режимах их нужно задать до первой строки листа.
+        """
+        if xlsxwriter:
+            self._write_excel_xlsxwriter(filepath, sheets)
+            return
+        
+        workbook = Workbook(write_only=True)
+        for title, header, rows in sheets:
+            worksheet = workbook.create_sheet(title)
+            
+            for column_index, width in enumerate(self._column_widths(header, rows), start=1):
+                worksheet.column_dimensions[get_column_letter(column_index)].width = width
+            
+            header_cells = []
+            for value in header:
+                cell = WriteOnlyCell(worksheet, value=value)
+                cell.font = _EXCEL_HEADER_FONT
+                cell.border = _EXCEL_HEADER_BORDER
+                cell.alignment = _EXCEL_HEADER_ALIGNMENT
+                header_cells.append(cell)
+            worksheet.append(header_cells)
             
-            # Автоподбор ширины колонок
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
+            for row in rows:
+                if any(value.__class__ is str and value.startswith('=') for value in row):
+                    row = [self._text_cell(worksheet, value) for value in row]
+                worksheet.append(row)
+        workbook.save(filepath)
+    
+    def _write_excel_xlsxwriter(self, filepath: str, sheets: Iterable[Tuple[str, Sequence[str], List[Tuple]]]):
+        """Запись листов в Excel файл через xlsxwriter (построчно, constant_memory)"""
+        # Строки пишутся как есть, как и в openpyxl: без автоссылок (они же
+        # отбрасывают URL длиннее 2079 символов) и без разбора формул
+        workbook = xlsxwriter.Workbook(filepath, _XLSXWRITER_OPTIONS)
+        try:
+            header_format = workbook.add_format(_XLSXWRITER_HEADER_FORMAT)
+            for title, header, rows in sheets:
+                worksheet = workbook.add_worksheet(title)
                 
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
+                for column_index, width in enumerate(self._column_widths(header, rows)):
+                    worksheet.set_column(column_index, column_index, width)
                 
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+                worksheet.write_row(0, 0, header, header_format)
+                for row_index, row in enumerate(rows, start=1):
+                    worksheet.write_row(row_index, 0, row)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _text_cell(worksheet, value):
+        """Ячейка write_only, в которой строка на '=' остаётся текстом, а не формулой"""
+        if value.__class__ is not str or not value.startswith('='):
+            return value
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.data_type = 's'
+        return cell
+    
+    @staticmethod
+    def _column_widths(header: Sequence[str], rows: List[Tuple]) -> List[int]:
+        """Автоподбор ширины колонок по самому длинному значению"""
+        # По колонкам целиком: str, len и max идут циклами на C через map,
+        # без обращения к ячейкам по одной
+        columns = zip(header, *rows)
+        return [min(max(map(len, map(str, column))) + _EXCEL_COLUMN_PADDING, _EXCEL_MAX_COLUMN_WIDTH)
+                for column in columns]
     
     def _create_empty_chart(self, filepath: str, message: str) -> str:
         """Создание пустой диаграммы с сообщением"""
@@ -447,7 +506,7 @@ class ReportGenerator:
         ax.set_ylim(0, 1)
         ax.axis('off')
         plt.tight_layout()
-        plt.savefig(filepath, dpi=300, bbox_inches='tight')
+        plt.savefig(filepath, dpi=config.CHART_DPI, bbox_inches='tight', pil_kwargs=_PNG_PIL_KWARGS)
         plt.close()
         return filepath
 
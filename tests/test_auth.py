@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты ограничения перебора паролей
+"""
+
+import unittest
+from unittest import mock
+
+import auth
+from auth import AuthManager
+from config import config
+
+
+class RateLimitTest(unittest.TestCase):
+    """Лимит неудачных попыток считается отдельно для каждого пользователя"""
+
+    def setUp(self):
+        # Маленький лимит, чтобы не считать scrypt десятки раз
+        patcher = mock.patch.object(auth, '_FAILED_LIMIT', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = AuthManager()
+
+    def _exhaust(self, telegram_id):
+        for _ in range(auth._FAILED_LIMIT + 1):
+            self.assertIsNone(self.manager.validate_password('wrong password', telegram_id))
+
+    def test_failures_block_only_their_user(self):
+        self._exhaust(1)
+
+        self.assertIsNone(self.manager.validate_password(config.USER_PASSWORD, 1))
+        self.assertEqual(self.manager.validate_password(config.USER_PASSWORD, 2), 'user')
+        self.assertEqual(self.manager.validate_password(config.ADMIN_PASSWORD, 2), 'admin')
+
+    def test_cached_password_not_blocked_by_other_user(self):
+        self.assertEqual(self.manager.validate_password(config.ADMIN_PASSWORD, 2), 'admin')
+        self._exhaust(1)
+
+        # Повторная проверка идёт через кэш и тоже не должна блокироваться
+        self.assertEqual(self.manager.validate_password(config.ADMIN_PASSWORD, 2), 'admin')
+
+
+if __name__ == '__main__':
+    unittest.main()
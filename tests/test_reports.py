@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты записи Excel-отчётов
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from openpyxl import load_workbook
+
+from config import config
+
+_TMP_DIR = tempfile.TemporaryDirectory()
+# reports при импорте открывает БД: держим её во временной папке
+config.DATABASE_PATH = os.path.join(_TMP_DIR.name, 'test.db')
+
+import reports  # noqa: E402
+from reports import ReportGenerator  # noqa: E402
+
+# Описание длиннее 2079 символов: xlsxwriter с автоссылками такую строку отбрасывает
+_LONG_URL = 'https://example.com/' + 'a' * 3000
+_HEADER = ('ID', 'Описание')
+_ROWS = [(1, _LONG_URL), (2, '=1+1'), (3, 'http://example.com')]
+
+
+def tearDownModule():
+    _TMP_DIR.cleanup()
+
+
+class WriteExcelTest(unittest.TestCase):
+    """Оба способа записи дают одинаковые ячейки"""
+
+    def _write_and_read(self, filename):
+        filepath = os.path.join(_TMP_DIR.name, filename)
+        ReportGenerator()._write_excel(filepath, (('Задачи', _HEADER, _ROWS),))
+        worksheet = load_workbook(filepath)['Задачи']
+        return [tuple((cell.value, cell.data_type, cell.hyperlink) for cell in row)
+                for row in worksheet.iter_rows(min_row=2)]
+
+    def _assert_cells_kept(self, cells):
+        self.assertEqual([tuple(value for value, _, _ in row) for row in cells], _ROWS)
+        for row in cells:
+            for value, data_type, hyperlink in row:
+                self.assertIsNone(hyperlink)
+                if isinstance(value, str):
+                    self.assertEqual(data_type, 's')
+
+    def test_openpyxl_keeps_long_url(self):
+        with mock.patch.object(reports, 'xlsxwriter', None):
+            self._assert_cells_kept(self._write_and_read('openpyxl.xlsx'))
+
+    @unittest.skipUnless(reports.xlsxwriter, 'xlsxwriter не установлен')
+    def test_xlsxwriter_keeps_long_url(self):
+        self._assert_cells_kept(self._write_and_read('xlsxwriter.xlsx'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,38 +3,57 @@
 Утилиты для форматирования и валидации данных
 """
 
+import html
 import re
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Dict, Optional
 from config import EMOJIS, TASK_STATUS, TASK_PRIORITY, config
 
+# Часовой пояс отображения: один объект на процесс
+DISPLAY_TZ = timezone(timedelta(hours=config.DISPLAY_TZ_OFFSET_HOURS))
+
 def _to_local_time(dt: datetime) -> datetime:
     """Интерпретируем на входе UTC (если tzinfo отсутствует) и конвертируем в локальный сдвиг из конфигурации."""
     if not dt:
         return None
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
-    target_tz = timezone(timedelta(hours=config.DISPLAY_TZ_OFFSET_HOURS))
-    return dt.astimezone(target_tz)
+    return dt.astimezone(DISPLAY_TZ)
+
+def utc_now() -> datetime:
+    """Текущее время UTC без tzinfo (в таком виде время хранится в БД)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 def get_current_tashkent_time() -> datetime:
     """Получить текущее время в Ташкенте (UTC+5)"""
-    utc_now = datetime.utcnow().replace(tzinfo=timezone.utc)
-    tashkent_tz = timezone(timedelta(hours=config.DISPLAY_TZ_OFFSET_HOURS))
-    return utc_now.astimezone(tashkent_tz).replace(tzinfo=None)
+    return datetime.now(DISPLAY_TZ).replace(tzinfo=None)
 
 def to_utc(dt: datetime) -> Optional[datetime]:
     """Конвертировать локальное время (по DISPLAY_TZ_OFFSET_HOURS) в UTC (naive)."""
     if not dt:
         return None
     if dt.tzinfo is None:
-        local_tz = timezone(timedelta(hours=config.DISPLAY_TZ_OFFSET_HOURS))
-        dt = dt.replace(tzinfo=local_tz)
+        dt = dt.replace(tzinfo=DISPLAY_TZ)
     return dt.astimezone(timezone.utc).replace(tzinfo=None)
 
+@lru_cache(maxsize=4096)
+def parse_db_datetime(value: str) -> datetime:
+    """
+    Разбор отметки времени из БД (ISO-строка) в datetime
+    
+    Результат кэшируется: дедлайны одних и тех же задач разбираются
+    при каждом обходе уведомлений и построении отчётов.
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+@lru_cache(maxsize=4096)
 def format_datetime(dt: datetime, show_time: bool = True, is_deadline: bool = False) -> str:
     """
-    Форматирование даты и времени
+    Форматирование даты и времени (результат кэшируется: одни и те же
+    отметки времени повторяются в списках и истории)
     
     Args:
         dt: Объект datetime
@@ -48,7 +67,7 @@ def format_datetime(dt: datetime, show_time: bool = True, is_deadline: bool = Fa
     
     if isinstance(dt, str):
         try:
-            dt = datetime.fromisoformat(dt.replace('Z', '+00:00'))
+            dt = parse_db_datetime(dt)
         except:
             return dt
     dt_local = _to_local_time(dt)
@@ -56,59 +75,60 @@ def format_datetime(dt: datetime, show_time: bool = True, is_deadline: bool = Fa
         return dt_local.strftime("%d.%m.%Y %H:%M")
     return dt_local.strftime("%d.%m.%Y")
 
-def format_task(task: Dict, detailed: bool = False) -> str:
+def format_task(task: Dict, detailed: bool = False, now: Optional[datetime] = None) -> str:
     """
     Форматирование информации о задаче
     
     Args:
         task: Словарь с данными задачи
         detailed: Показывать ли подробную информацию
+        now: Текущее время UTC (naive) для проверки просрочки; по умолчанию - сейчас
         
     Returns:
-        Отформатированная строка
+        Отформатированная строка (HTML, пользовательские поля экранированы)
     """
     # Эмодзи для статуса и приоритета
     status_emoji = EMOJIS.get(task['status'], EMOJIS['pending'])
     priority_emoji = EMOJIS.get(f'priority_{task["priority"]}', '')
     
     # Заголовок
-    text = f"{status_emoji} **{task['title']}**\n\n"
+    text = f"{status_emoji} <b>{html.escape(task['title'])}</b>\n\n"
     
     if detailed:
         # Подробная информация
-        text += f"🆔 **ID:** {task['id']}\n"
-        text += f"📝 **Описание:** {task['description'] or 'Не указано'}\n\n"
+        text += f"🆔 <b>ID:</b> {task['id']}\n"
+        text += f"📝 <b>Описание:</b> {html.escape(task['description'] or 'Не указано')}\n\n"
         
-        text += f"👤 **Создатель:** {task['creator_name'] or 'Неизвестно'}\n"
-        text += f"🎯 **Исполнитель:** {task['assignee_name'] or 'Не назначен'}\n\n"
+        text += f"👤 <b>Создатель:</b> {html.escape(task['creator_name'] or 'Неизвестно')}\n"
+        text += f"🎯 <b>Исполнитель:</b> {html.escape(task['assignee_name'] or 'Не назначен')}\n\n"
         
-        text += f"📊 **Статус:** {TASK_STATUS[task['status']]} {status_emoji}\n"
-        text += f"🔥 **Приоритет:** {TASK_PRIORITY[task['priority']]} {priority_emoji}\n\n"
+        text += f"📊 <b>Статус:</b> {TASK_STATUS[task['status']]} {status_emoji}\n"
+        text += f"🔥 <b>Приоритет:</b> {TASK_PRIORITY[task['priority']]} {priority_emoji}\n\n"
         
         # Даты
         created_at = format_datetime(task['created_at'])
-        text += f"📅 **Создано:** {created_at}\n"
+        text += f"📅 <b>Создано:</b> {created_at}\n"
         
         if task['deadline']:
             deadline = format_datetime(task['deadline'], is_deadline=True)
-            text += f"⏰ **Дедлайн:** {deadline}\n"
+            text += f"⏰ <b>Дедлайн:</b> {deadline}\n"
         
         if task['completed_at']:
             completed_at = format_datetime(task['completed_at'])
-            text += f"✅ **Выполнено:** {completed_at}\n"
+            text += f"✅ <b>Выполнено:</b> {completed_at}\n"
         
         # Статус просрочки (сравнение в UTC)
         if task['deadline'] and task['status'] not in ['completed', 'cancelled']:
-            deadline_dt = datetime.fromisoformat(task['deadline'].replace('Z', '+00:00')) if isinstance(task['deadline'], str) else task['deadline']
+            deadline_dt = parse_db_datetime(task['deadline'])
             if isinstance(deadline_dt, datetime):
                 if deadline_dt.tzinfo is None:
                     deadline_dt = deadline_dt.replace(tzinfo=timezone.utc)
-                now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
+                now_utc = (now or utc_now()).replace(tzinfo=timezone.utc)
                 if deadline_dt < now_utc:
-                    text += f"\n⚠️ **ЗАДАЧА ПРОСРОЧЕНА!**"
+                    text += f"\n⚠️ <b>ЗАДАЧА ПРОСРОЧЕНА!</b>"
     else:
         # Краткая информация
-        text += f"🎯 {task['assignee_name'] or 'Не назначен'}\n"
+        text += f"🎯 {html.escape(task['assignee_name'] or 'Не назначен')}\n"
         text += f"🔥 {TASK_PRIORITY[task['priority']]}\n"
         
         if task['deadline']:
@@ -117,6 +137,39 @@ def format_task(task: Dict, detailed: bool = False) -> str:
     
     return text
 
+# Абсолютные даты: ДД.ММ.ГГГГ, ДД/ММ/ГГГГ или ГГГГ-ММ-ДД, время ЧЧ:ММ необязательно
+_DMY_RE = re.compile(r'(\d{1,2})([./])(\d{1,2})\2(\d{4})(?:\s+(\d{1,2}):(\d{1,2}))?')
+_YMD_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:\s+(\d{1,2}):(\d{1,2}))?')
+
+# Относительные даты: "через X дней/часов/минут", "завтра", "послезавтра"
+_RELATIVE_RE = re.compile(r'через (\d+) (дн|ч|мин)')
+_RELATIVE_UNITS = {'дн': 'days', 'ч': 'hours', 'мин': 'minutes'}
+# "послезавтра" содержит "завтра", поэтому проверяется первым
+_DAY_WORDS = (('послезавтра', 2), ('завтра', 1))
+
+# Telegram username: 5-32 символа, буквы, цифры, подчеркивания, начинается с буквы
+_TG_USERNAME_RE = re.compile(r'[a-zA-Z][a-zA-Z0-9_]{4,31}')
+
+@lru_cache(maxsize=512)
+def _parse_absolute_deadline(deadline_str: str) -> Optional[datetime]:
+    """Разбор абсолютной даты (не зависит от текущего времени, поэтому кэшируется)"""
+    match = _DMY_RE.fullmatch(deadline_str)
+    if match:
+        day, _, month, year, hour, minute = match.groups()
+    else:
+        match = _YMD_RE.fullmatch(deadline_str)
+        if not match:
+            return None
+        year, month, day, hour, minute = match.groups()
+    
+    try:
+        if hour is None:
+            # Если время не указано, устанавливаем конец дня
+            return datetime(int(year), int(month), int(day), 23, 59, 59)
+        return datetime(int(year), int(month), int(day), int(hour), int(minute))
+    except ValueError:
+        return None
+
 def validate_deadline(deadline_str: str) -> Optional[datetime]:
     """
     Валидация и парсинг дедлайна
@@ -130,43 +183,21 @@ def validate_deadline(deadline_str: str) -> Optional[datetime]:
     if not deadline_str:
         return None
     
-    # Поддерживаемые форматы
-    formats = [
-        "%d.%m.%Y %H:%M",
-        "%d.%m.%Y",
-        "%d/%m/%Y %H:%M", 
-        "%d/%m/%Y",
-        "%Y-%m-%d %H:%M",
-        "%Y-%m-%d"
-    ]
-    
-    for fmt in formats:
-        try:
-            dt = datetime.strptime(deadline_str, fmt)
-            # Если время не указано, устанавливаем конец дня
-            if "%H:%M" not in fmt:
-                dt = dt.replace(hour=23, minute=59, second=59)
-            return dt
-        except ValueError:
-            continue
+    dt = _parse_absolute_deadline(deadline_str)
+    if dt:
+        return dt
     
     # Попробуем относительные форматы
     deadline_str = deadline_str.lower().strip()
-    
-    # "через X дней/часов/минут"
     current_time = get_current_tashkent_time()
-    patterns = [
-        (r'через (\d+) дн', lambda x: current_time + timedelta(days=int(x))),
-        (r'через (\d+) ч', lambda x: current_time + timedelta(hours=int(x))),
-        (r'через (\d+) мин', lambda x: current_time + timedelta(minutes=int(x))),
-        (r'завтра', lambda x: current_time.replace(hour=23, minute=59, second=59) + timedelta(days=1)),
-        (r'послезавтра', lambda x: current_time.replace(hour=23, minute=59, second=59) + timedelta(days=2)),
-    ]
     
-    for pattern, func in patterns:
-        match = re.search(pattern, deadline_str)
-        if match:
-            return func(match.group(1) if match.groups() else None)
+    match = _RELATIVE_RE.search(deadline_str)
+    if match:
+        return current_time + timedelta(**{_RELATIVE_UNITS[match.group(2)]: int(match.group(1))})
+    
+    for word, days in _DAY_WORDS:
+        if word in deadline_str:
+            return current_time.replace(hour=23, minute=59, second=59) + timedelta(days=days)
     
     return None
 
@@ -190,8 +221,8 @@ def truncate_text(text: str, max_length: int = 50, suffix: str = "...") -> str:
 def format_user_mention(user_name: str, user_id: int = None) -> str:
     """Форматирование упоминания пользователя"""
     if user_id:
-        return f"[@{user_name}](tg://user?id={user_id})"
-    return f"**{user_name}**"
+        return f'<a href="tg://user?id={user_id}">@{html.escape(user_name)}</a>'
+    return f"<b>{html.escape(user_name)}</b>"
 
 def get_status_emoji(status: str) -> str:
     """Получение эмодзи для статуса"""
@@ -212,31 +243,30 @@ def format_progress_bar(completed: int, total: int, length: int = 10) -> str:
     
     return f"{bar} {percentage}%"
 
-def parse_priority(priority_str: str) -> str:
-    """Парсинг приоритета из строки"""
-    priority_str = priority_str.lower().strip()
+# Варианты ввода приоритета (в нижнем регистре) -> код приоритета
+_PRIORITY_MAP = {
+    'низкий': 'low',
+    'низ': 'low',
+    'low': 'low',
+    'l': 'low',
+    '1': 'low',
     
-    priority_map = {
-        'низкий': 'low',
-        'низ': 'low',
-        'low': 'low',
-        'l': 'low',
-        '1': 'low',
-        
-        'средний': 'medium',
-        'сред': 'medium',
-        'medium': 'medium',
-        'm': 'medium',
-        '2': 'medium',
-        
-        'высокий': 'high',
-        'выс': 'high',
-        'high': 'high',
-        'h': 'high',
-        '3': 'high',
-    }
+    'средний': 'medium',
+    'сред': 'medium',
+    'medium': 'medium',
+    'm': 'medium',
+    '2': 'medium',
     
-    return priority_map.get(priority_str, 'medium')
+    'высокий': 'high',
+    'выс': 'high',
+    'high': 'high',
+    'h': 'high',
+    '3': 'high',
+}
+
+def parse_priority(priority_str: str) -> str:
+    """Парсинг приоритета из строки"""
+    return _PRIORITY_MAP.get(priority_str.lower().strip(), 'medium')
 
 def is_valid_telegram_username(username: str) -> bool:
     """Проверка валидности Telegram username"""
@@ -244,11 +274,7 @@ def is_valid_telegram_username(username: str) -> bool:
         return False
     
     # Убираем @ если есть
-    username = username.lstrip('@')
-    
-    # Проверяем формат: 5-32 символа, буквы, цифры, подчеркивания
-    pattern = r'^[a-zA-Z][a-zA-Z0-9_]{4,31}$'
-    return bool(re.match(pattern, username))
+    return _TG_USERNAME_RE.fullmatch(username.lstrip('@')) is not None
 
 def format_duration(start_time: datetime, end_time: datetime = None) -> str:
     """Форматирование продолжительности"""